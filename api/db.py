@@ -1,6 +1,13 @@
 import os
 import pymongo
 from pymongo import MongoClient
+from pymongo import monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import ReadPreference, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+from contextlib import contextmanager
+import contextvars
+import threading
 import certifi
 import logging
 
@@ -11,25 +18,86 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Singleton pattern for database connection
+# Database roles handed out by get_db():
+# - primary: auth and write paths, reads from the primary with an explicit write concern
+# - analytics: stats and rollups, may read from secondaries with bounded staleness
+# - public: unauthenticated profile reads, same routing as analytics
+ROLE_PRIMARY = 'primary'
+ROLE_ANALYTICS = 'analytics'
+ROLE_PUBLIC = 'public'
+
+# One client per process: a MongoClient must not be used across fork(), so the
+# pid that created it is recorded and a forked worker builds its own
 _db = None
+_db_pid = None
+_db_lock = threading.Lock()
+_role_handles = {}
+_pool_stats = None
+# Set once indexes exist; inherited by forked workers so they skip the work
+_indexes_created = False
+
+# Indexes replaced by later definitions, dropped from existing deployments
+SUPERSEDED_INDEXES = {
+    'regards': [
+        # Replaced by (recipient.walletAddress, status, createdAt)
+        'recipient.walletAddress_1_createdAt_-1',
+        # Prefixes of the compound sender / recipient indexes below
+        'sender.walletAddress_1',
+        'recipient.walletAddress_1'
+    ]
+}
+
+# Causally consistent session of the current read_your_writes() block
+_session = contextvars.ContextVar('mongo_session', default=None)
 
-def get_db():
+def get_db(role=ROLE_PRIMARY):
     """
     Get a MongoDB database connection
-    Uses singleton pattern to reuse the same connection
+    Uses one client per process, created on first use (after fork in gunicorn workers)
+    
+    Args:
+        role (str): ROLE_PRIMARY, ROLE_ANALYTICS or ROLE_PUBLIC
     
     Returns:
-        pymongo.database.Database: MongoDB database instance
+        pymongo.database.Database: MongoDB database instance configured for the role
+    """
+    if _db is not None and _db_pid == os.getpid():
+        return _role_handle(role)
+    
+    with _db_lock:
+        if _db is None or _db_pid != os.getpid():
+            _connect()
+    return _role_handle(role)
+
+def _pool_options():
+    """
+    Size the connection pool of this process from the serving configuration
+    
+    A worker needs a connection per request thread (GUNICORN_THREADS) plus one
+    per fan-out thread (FANOUT_WORKERS) and a few for background threads.
+    MONGODB_MAX_POOL_SIZE and MONGODB_MIN_POOL_SIZE override the computed sizes.
+    """
+    from api.utils.workers import FANOUT_WORKERS
+    threads = int(os.environ.get('GUNICORN_THREADS', 1))
+    max_pool_size = int(os.environ.get('MONGODB_MAX_POOL_SIZE', threads + FANOUT_WORKERS + 2))
+    min_pool_size = int(os.environ.get('MONGODB_MIN_POOL_SIZE', min(threads, max_pool_size)))
+    return {'maxPoolSize': max_pool_size, 'minPoolSize': min_pool_size}
+
+def _connect():
+    """
+    Create this process's client; the caller holds _db_lock
     """
-    global _db
+    global _db, _db_pid, _pool_stats, _indexes_created
     if _db is not None:
-        return _db
+        # Inherited from the parent process: drop it without closing, the
+        # parent still owns its sockets
+        logger.info("Process %d was forked, creating a new MongoDB client", os.getpid())
+    _db = None
+    _role_handles.clear()
     
     try:
         # Get MongoDB connection string from environment variable
         mongo_uri = os.getenv('MONGODB_URI')
-        print(mongo_uri)
         
         if not mongo_uri:
             # Use a default connection string for local development
@@ -38,7 +106,14 @@ def get_db():
         
         # Connect to MongoDB
         logger.info("Connecting to MongoDB at %s", mongo_uri.split('@')[-1])  # Don't log credentials
-        client = MongoClient(mongo_uri, tlsCAFile=certifi.where())
+        pool_options = _pool_options()
+        _pool_stats = PoolStats(**pool_options)
+        client = MongoClient(
+            mongo_uri,
+            tlsCAFile=certifi.where(),
+            event_listeners=[_pool_stats],
+            **pool_options
+        )
         
         # Verify connection by attempting to get server info
         client.server_info()
@@ -48,12 +123,14 @@ def get_db():
         
         # Get database
         _db = client[db_name]
+        _db_pid = os.getpid()
         
         # Create indexes for collections
-        _create_indexes(_db)
+        if not _indexes_created:
+            _create_indexes(_db)
+            _indexes_created = True
         
-        logger.info("MongoDB connection successful to database: %s", db_name)
-        return _db
+        logger.info("MongoDB connection successful to database: %s (pool %s)", db_name, pool_options)
     
     except pymongo.errors.ServerSelectionTimeoutError as e:
         logger.error("MongoDB connection error: Could not connect to server: %s", str(e))
@@ -65,6 +142,175 @@ def get_db():
         logger.error("MongoDB connection error: %s", str(e))
         raise
 
+def _reset_after_fork():
+    """
+    Forget the parent's client in a forked child (registered with os.register_at_fork)
+    """
+    global _db, _db_pid, _db_lock, _pool_stats
+    _db = None
+    _db_pid = None
+    # The parent may have held the lock while forking
+    _db_lock = threading.Lock()
+    _pool_stats = None
+    _role_handles.clear()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener keeping live counters for this process's client
+    """
+    
+    def __init__(self, maxPoolSize, minPoolSize):
+        self.max_pool_size = maxPoolSize
+        self.min_pool_size = minPoolSize
+        self._lock = threading.Lock()
+        self._servers = {}
+    
+    def _update(self, address, **deltas):
+        key = '%s:%s' % address
+        with self._lock:
+            counters = self._servers.setdefault(key, {
+                'open': 0, 'inUse': 0, 'waiting': 0, 'checkOutFailures': 0, 'cleared': 0
+            })
+            for name, delta in deltas.items():
+                counters[name] += delta
+    
+    def pool_created(self, event):
+        self._update(event.address)
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+    
+    def pool_closed(self, event):
+        with self._lock:
+            self._servers.pop('%s:%s' % event.address, None)
+    
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+    
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+    
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkOutFailures=1)
+    
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, inUse=1)
+    
+    def connection_checked_in(self, event):
+        self._update(event.address, inUse=-1)
+    
+    def snapshot(self):
+        """
+        Get the pool configuration and counters summed over all servers
+        """
+        with self._lock:
+            servers = [dict(counters) for counters in self._servers.values()]
+        totals = {name: sum(counters[name] for counters in servers)
+                  for name in ('open', 'inUse', 'waiting', 'checkOutFailures', 'cleared')}
+        return {
+            'pid': os.getpid(),
+            'maxPoolSize': self.max_pool_size,
+            'minPoolSize': self.min_pool_size,
+            'servers': len(servers),
+            **totals
+        }
+
+def get_pool_stats():
+    """
+    Get connection pool statistics of this process
+    
+    Returns:
+        dict: Pool sizes and open / in-use / waiting connection counts, or None before the first connection
+    """
+    stats = _pool_stats
+    if stats is None or _db_pid != os.getpid():
+        return None
+    return stats.snapshot()
+
+def warm_up_db():
+    """
+    Connect this process and open connections before it serves requests
+    
+    Pings the primary and a secondary-preferred server so the first requests
+    of each role skip connection setup; minPoolSize keeps the pools filled.
+    """
+    client = get_db().client
+    client.admin.command('ping')
+    client.admin.command('ping', read_preference=SecondaryPreferred())
+
+def _role_handle(role):
+    """
+    Get (and cache) the database handle for a role
+    
+    Secondary reads use maxStalenessSeconds from MONGODB_MAX_STALENESS_SECONDS
+    (90 minimum). Inside read_your_writes() they also use majority read
+    concern, which causal consistency needs to see the session's own writes.
+    """
+    causal = _session.get() is not None and role != ROLE_PRIMARY
+    key = (role, causal)
+    handle = _role_handles.get(key)
+    if handle is not None:
+        return handle
+    
+    if role == ROLE_PRIMARY:
+        w = os.environ.get('MONGODB_WRITE_CONCERN', 'majority')
+        handle = _db.with_options(
+            read_preference=ReadPreference.PRIMARY,
+            write_concern=WriteConcern(
+                w=int(w) if w.isdigit() else w,
+                wtimeout=int(os.environ.get('MONGODB_WTIMEOUT_MS', 5000))
+            )
+        )
+    elif role in (ROLE_ANALYTICS, ROLE_PUBLIC):
+        max_staleness = max(90, int(os.environ.get('MONGODB_MAX_STALENESS_SECONDS', 90)))
+        handle = _db.with_options(
+            read_preference=SecondaryPreferred(max_staleness=max_staleness),
+            read_concern=ReadConcern('majority') if causal else None
+        )
+    else:
+        raise ValueError(f"Unknown database role: {role}")
+    
+    _role_handles[key] = handle
+    return handle
+
+@contextmanager
+def read_your_writes():
+    """
+    Run a block in a causally consistent session
+    
+    Model functions called inside the block pass the session to MongoDB, so
+    reads routed to secondaries still observe the block's earlier writes.
+    
+    Example:
+        with read_your_writes():
+            update_user(wallet, data)
+            stats = get_regard_stats(wallet)
+    """
+    client = get_db().client
+    with client.start_session(causal_consistency=True) as session:
+        token = _session.set(session)
+        try:
+            yield session
+        finally:
+            _session.reset(token)
+
+def current_session():
+    """
+    Get the session of the enclosing read_your_writes() block (None outside one)
+    """
+    return _session.get()
+
 def _create_indexes(db):
     """
     Create indexes for collections
@@ -78,16 +324,116 @@ def _create_indexes(db):
         db.users.create_index('username', unique=True)
         
         # Regards collection indexes
-        db.regards.create_index('sender.walletAddress')
-        db.regards.create_index('recipient.walletAddress')
         db.regards.create_index('transactionSignature', unique=True)
         db.regards.create_index('createdAt')
         
         # Create compound indexes for common queries
+        # Received list: the status filter is part of the index, so pages
+        # read only the documents they return
+        db.regards.create_index([
+            ('recipient.walletAddress', pymongo.ASCENDING),
+            ('status', pymongo.ASCENDING),
+            ('createdAt', pymongo.DESCENDING)
+        ])
+        # Sent history: filter and (createdAt, _id) keyset order straight from the index
+        db.regards.create_index([
+            ('sender.walletAddress', pymongo.ASCENDING),
+            ('status', pymongo.ASCENDING),
+            ('createdAt', pymongo.DESCENDING),
+            ('_id', pymongo.DESCENDING)
+        ])
+        # Serves full-history exports: filter and _id order straight from the index
+        db.regards.create_index([
+            ('recipient.walletAddress', pymongo.ASCENDING),
+            ('status', pymongo.ASCENDING),
+            ('_id', pymongo.ASCENDING)
+        ])
+        # NFT collections: only regards carrying a certificate are indexed
         db.regards.create_index([
             ('recipient.walletAddress', pymongo.ASCENDING),
             ('createdAt', pymongo.DESCENDING)
+        ], name='recipient_nft_createdAt', partialFilterExpression={'includesNft': True})
+        # Message search: the recipient prefix keeps every search inside one
+        # user's regards, and the status suffix filters on the index keys
+        db.regards.create_index([
+            ('recipient.walletAddress', pymongo.ASCENDING),
+            ('message', pymongo.TEXT),
+            ('status', pymongo.ASCENDING)
+        ], name='recipient_message_text')
+
+        # Regards that never complete expire; completed regards have no expiresAt
+        db.regards.create_index('expiresAt', expireAfterSeconds=0)
+
+        # Outbox: only regards with an undelivered notification are indexed
+        db.regards.create_index(
+            'outbox.nextAttemptAt',
+            name='outbox_due',
+            partialFilterExpression={'outbox.state': 'pending'}
+        )
+
+        # Webhooks, listed and fanned out per owner
+        db.webhooks.create_index('walletAddress')
+
+        # Archive of completed regards past the hot horizon, indexed for the
+        # same list, sent, export and lookup paths as the hot collection
+        db.regards_archive.create_index('transactionSignature', unique=True)
+        # Copies of an unfinished archive batch, found by the next run
+        db.regards_archive.create_index(
+            'archivePending',
+            name='archive_pending',
+            partialFilterExpression={'archivePending': {'$exists': True}}
+        )
+        db.regards_archive.create_index([
+            ('recipient.walletAddress', pymongo.ASCENDING),
+            ('status', pymongo.ASCENDING),
+            ('createdAt', pymongo.DESCENDING)
+        ])
+        db.regards_archive.create_index([
+            ('sender.walletAddress', pymongo.ASCENDING),
+            ('status', pymongo.ASCENDING),
+            ('createdAt', pymongo.DESCENDING),
+            ('_id', pymongo.DESCENDING)
         ])
+        db.regards_archive.create_index([
+            ('recipient.walletAddress', pymongo.ASCENDING),
+            ('status', pymongo.ASCENDING),
+            ('_id', pymongo.ASCENDING)
+        ])
+        db.regards_archive.create_index([
+            ('recipient.walletAddress', pymongo.ASCENDING),
+            ('createdAt', pymongo.DESCENDING)
+        ], name='recipient_nft_createdAt', partialFilterExpression={'includesNft': True})
+
+        # Daily rollup buckets, one per recipient per day
+        db.regard_daily.create_index([
+            ('recipient', pymongo.ASCENDING),
+            ('day', pymongo.ASCENDING)
+        ], unique=True)
+
+        # Sender stats: one pair document per sender/recipient
+        db.sender_recipients.create_index([
+            ('sender', pymongo.ASCENDING),
+            ('recipient', pymongo.ASCENDING)
+        ], unique=True)
+
+        # Trending buckets, one per recipient per hour; expired after 31 days,
+        # one day past the longest leaderboard window
+        db.trending_hourly.create_index([
+            ('hour', pymongo.ASCENDING),
+            ('recipient', pymongo.ASCENDING)
+        ], unique=True)
+        db.trending_hourly.create_index('hour', name='hour_ttl', expireAfterSeconds=31 * 24 * 3600)
+
+        # On-chain reconciliation checkpoints, one per wallet
+        db.reconcile_checkpoints.create_index('walletAddress', unique=True)
+        
+        # Dropped once their replacements exist, so queries always have an index
+        for collection, names in SUPERSEDED_INDEXES.items():
+            existing = db[collection].index_information()
+            for name in names:
+                if name in existing:
+                    db[collection].drop_index(name)
+                    logger.info("Dropped superseded index %s.%s", collection, name)
         logger.info("MongoDB indexes created successfully")
     except Exception as e:
         logger.error("Error creating MongoDB indexes: %s", str(e))
@@ -98,9 +444,13 @@ def close_db_connection():
     Close the MongoDB connection
     Should be called when the application is shutting down
     """
-    global _db
-    if _db is not None:
-        client = _db.client
-        client.close()
+    global _db, _db_pid, _pool_stats
+    with _db_lock:
+        if _db is not None and _db_pid == os.getpid():
+            client = _db.client
+            client.close()
+            logger.info("MongoDB connection closed")
         _db = None
-        logger.info("MongoDB connection closed") 
\ No newline at end of file
+        _db_pid = None
+        _pool_stats = None
+        _role_handles.clear() 
\ No newline at end of file
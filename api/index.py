@@ -19,15 +19,24 @@ app.config.update(
     DEBUG=os.environ.get('FLASK_ENV', 'development') == 'development'
 )
 
+# Give every request a deadline that reaches MongoDB and Solana RPC calls
+from api.middleware.deadline import init_deadlines, with_deadline
+init_deadlines(app)
+
+from pymongo.errors import PyMongoError
+from api.db import get_db, get_pool_stats
+
 # Import routes after app creation to avoid circular imports
 from api.routes.auth import auth_bp
 from api.routes.users import users_bp
 from api.routes.regards import regards_bp
+from api.routes.nft import nft_bp
 
 # Register blueprints for different API routes
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(users_bp, url_prefix='/api/users')
 app.register_blueprint(regards_bp, url_prefix='/api/regards')
+app.register_blueprint(nft_bp, url_prefix='/api/nft')
 
 # Root route for testing
 @app.route('/')
@@ -38,6 +47,16 @@ def home():
         "version": "1.0.0"
     })
 
+# Health check for load balancers, with this worker's connection pool statistics
+@app.route('/api/health')
+@with_deadline(2)
+def health():
+    try:
+        get_db().client.admin.command('ping')
+    except PyMongoError:
+        return jsonify({"status": "unavailable", "database": "unreachable", "pool": get_pool_stats()}), 503
+    return jsonify({"status": "ok", "database": "ok", "pool": get_pool_stats()})
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
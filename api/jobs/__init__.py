@@ -0,0 +1,5 @@
+# Jobs package initialization
+"""
+Background and maintenance jobs for DropRegards API
+Run with: python -m api.jobs.<job>
+"""
@@ -0,0 +1,117 @@
+"""
+Move completed regards past the hot horizon into the archive collection
+
+Regards are moved oldest first in batches read from the createdAt index. Each
+batch is inserted into regards_archive flagged archivePending, deleted from
+regards, then unflagged. Readers ignore flagged copies (see
+api/models/archive.py), so a regard is never visible in both tiers. A run that
+stops part way leaves flagged copies, and the next run finishes them first.
+
+Failed and abandoned pending regards are not archived; the expiresAt TTL
+index removes them.
+
+Usage:
+    python -m api.jobs.archive [--hot-days N] [--batch-size N] [--max-docs-per-second N]
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta, UTC
+from pymongo.errors import BulkWriteError
+from api.db import get_db
+from api.models.regard import REGARDS_HOT_DAYS, MIN_HOT_DAYS
+from api.models.archive import ARCHIVE_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+# Duplicate key error code, raised for regards archived by an interrupted run
+DUPLICATE_KEY = 11000
+
+def _finish_batch(db, archive, ids):
+    """
+    Delete the hot originals of archived copies, then make the copies visible
+
+    Returns:
+        int: Number of hot regards deleted
+    """
+    result = db.regards.delete_many({'_id': {'$in': ids}})
+    archive.update_many({'_id': {'$in': ids}}, {'$unset': {'archivePending': ''}})
+    return result.deleted_count
+
+def _finish_interrupted(db, archive, batch_size):
+    """
+    Finish the batches an interrupted run copied but did not complete
+
+    Returns:
+        int: Number of hot regards deleted
+    """
+    finished = 0
+    while True:
+        ids = [doc['_id'] for doc in archive.find({'archivePending': True}, {'_id': 1}).limit(batch_size)]
+        if not ids:
+            return finished
+        finished += _finish_batch(db, archive, ids)
+
+def archive_regards(hot_days=REGARDS_HOT_DAYS, batch_size=DEFAULT_BATCH_SIZE, max_docs_per_second=None):
+    """
+    Move completed regards older than `hot_days` into the archive
+
+    Args:
+        hot_days (int): Age in days after which a completed regard is archived
+        batch_size (int): Regards moved per batch
+        max_docs_per_second (float): Throttle so live traffic keeps its share of the primary
+
+    Returns:
+        dict: Number of regards archived
+    """
+    db = get_db()
+    archive = db[ARCHIVE_COLLECTION]
+    cutoff = datetime.now(UTC) - timedelta(days=hot_days)
+    # Regards still waiting for webhook delivery stay hot until the dispatcher is done
+    query = {'createdAt': {'$lt': cutoff}, 'status': 'completed', 'outbox.state': {'$ne': 'pending'}}
+
+    archived = _finish_interrupted(db, archive, batch_size)
+    if archived:
+        logger.info("Finished %d regards left by an interrupted run", archived)
+    logger.info("Archiving completed regards created before %s", cutoff.isoformat())
+    while True:
+        docs = list(db.regards.find(query).sort('createdAt', 1).limit(batch_size))
+        if not docs:
+            break
+
+        started = time.monotonic()
+        for doc in docs:
+            doc['archivePending'] = True
+        try:
+            archive.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(error['code'] != DUPLICATE_KEY for error in e.details['writeErrors']):
+                raise
+
+        # Only delete once every regard of the batch is safely in the archive
+        archived += _finish_batch(db, archive, [doc['_id'] for doc in docs])
+        logger.info("Archived %d regards (up to %s)", archived, docs[-1]['createdAt'].isoformat())
+
+        if max_docs_per_second:
+            delay = len(docs) / max_docs_per_second - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    return {'archived': archived}
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old completed regards into the archive collection")
+    parser.add_argument('--hot-days', type=int, default=REGARDS_HOT_DAYS)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-docs-per-second', type=float, default=None)
+    args = parser.parse_args()
+
+    if args.hot_days < MIN_HOT_DAYS:
+        parser.error(f"--hot-days must be at least {MIN_HOT_DAYS}")
+
+    summary = archive_regards(args.hot_days, args.batch_size, args.max_docs_per_second)
+    logger.info("Archiving finished: %s", summary)
+
+if __name__ == '__main__':
+    main()
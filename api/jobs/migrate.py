@@ -0,0 +1,267 @@
+"""
+Resumable bulk migrations for the users and regards collections
+
+A migration visits the documents of one collection in _id order, one batch at
+a time. Each batch is a fresh indexed range query on _id, so no cursor stays
+open while writes are throttled. Changes are applied with unordered bulk_write
+and the last _id of every batch is checkpointed in the `migrations`
+collection, so an interrupted run resumes where it stopped.
+
+Usage:
+    python -m api.jobs.migrate list
+    python -m api.jobs.migrate run NAME [--dry-run] [--batch-size N]
+                                        [--max-writes-per-second N] [--restart]
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, UTC
+from pymongo import UpdateOne
+from api.db import get_db
+from api.models.regard import expiry_for_status
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+# Log progress every this many visited documents
+PROGRESS_EVERY = 10_000
+
+MIGRATIONS = {}
+
+def register(cls):
+    """
+    Class decorator adding a migration to the registry
+    """
+    MIGRATIONS[cls.name] = cls()
+    return cls
+
+class Migration:
+    """
+    Base class of a migration
+
+    Subclasses set `name`, `collection` and optionally `query` (documents to
+    visit; must not constrain _id) and `projection`, then implement
+    `transform` or, when a batch needs extra lookups, `transform_batch`.
+    """
+    name = None
+    collection = None
+    description = ''
+    query = {}
+    projection = None
+
+    def transform(self, doc):
+        """
+        Get the write operations for one document
+
+        Returns:
+            list: pymongo write operations (empty if the document is up to date)
+        """
+        raise NotImplementedError
+
+    def transform_batch(self, db, docs):
+        """
+        Get the write operations for a batch of documents
+        """
+        operations = []
+        for doc in docs:
+            operations.extend(self.transform(doc))
+        return operations
+
+@register
+class NormalizeUsernames(Migration):
+    name = 'users-normalize-username'
+    collection = 'users'
+    description = 'Add usernameLower for case-insensitive username lookups'
+    query = {'username': {'$type': 'string'}}
+    projection = {'username': 1, 'usernameLower': 1}
+
+    def transform(self, doc):
+        username_lower = doc['username'].lower()
+        if doc.get('usernameLower') == username_lower:
+            return []
+        return [UpdateOne({'_id': doc['_id']}, {'$set': {'usernameLower': username_lower}})]
+
+@register
+class SenderSnapshots(Migration):
+    name = 'regards-sender-snapshot'
+    collection = 'regards'
+    description = "Denormalize the sender's username and display name into each regard"
+    query = {'sender.walletAddress': {'$type': 'string'}}
+    projection = {'sender': 1}
+
+    def transform_batch(self, db, docs):
+        wallets = list({doc['sender']['walletAddress'] for doc in docs})
+        senders = {
+            user['walletAddress']: user
+            for user in db.users.find(
+                {'walletAddress': {'$in': wallets}},
+                {'walletAddress': 1, 'username': 1, 'displayName': 1}
+            )
+        }
+
+        operations = []
+        for doc in docs:
+            user = senders.get(doc['sender']['walletAddress'])
+            if not user:
+                continue
+            snapshot = {
+                'sender.username': user.get('username'),
+                'sender.displayName': user.get('displayName') or user.get('username')
+            }
+            current = {
+                'sender.username': doc['sender'].get('username'),
+                'sender.displayName': doc['sender'].get('displayName')
+            }
+            if snapshot != current:
+                operations.append(UpdateOne({'_id': doc['_id']}, {'$set': snapshot}))
+        return operations
+
+@register
+class ExpireUnfinishedRegards(Migration):
+    name = 'regards-expire-unfinished'
+    collection = 'regards'
+    description = 'Set expiresAt on pending and failed regards written before the TTL index'
+    query = {'status': {'$in': ['pending', 'failed']}, 'expiresAt': {'$exists': False}}
+    projection = {'status': 1}
+
+    def transform(self, doc):
+        # The status condition keeps a regard completed in the meantime from expiring
+        return [UpdateOne(
+            {'_id': doc['_id'], 'status': doc['status'], 'expiresAt': {'$exists': False}},
+            {'$set': {'expiresAt': expiry_for_status(doc['status'])}}
+        )]
+
+@register
+class WebhookCounts(Migration):
+    name = 'users-webhook-count'
+    collection = 'users'
+    description = 'Store the number of registered webhooks on each user'
+    projection = {'walletAddress': 1, 'webhookCount': 1}
+
+    def transform_batch(self, db, docs):
+        counts = {
+            row['_id']: row['count']
+            for row in db.webhooks.aggregate([
+                {'$match': {'walletAddress': {'$in': [doc.get('walletAddress') for doc in docs]}}},
+                {'$group': {'_id': '$walletAddress', 'count': {'$sum': 1}}}
+            ])
+        }
+        operations = []
+        for doc in docs:
+            count = counts.get(doc.get('walletAddress'), 0)
+            if doc.get('webhookCount', 0) != count:
+                operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'webhookCount': count}}))
+        return operations
+
+def run_migration(migration, batch_size=DEFAULT_BATCH_SIZE, max_writes_per_second=None,
+                  dry_run=False, restart=False):
+    """
+    Run a migration from its checkpoint to the end of the collection
+
+    Args:
+        migration (Migration): Migration to run
+        batch_size (int): Documents read and written per batch
+        max_writes_per_second (float): Throttle so live traffic keeps its share of the primary
+        dry_run (bool): Compute the changes without writing them or the checkpoint
+        restart (bool): Ignore the checkpoint and start from the first document
+
+    Returns:
+        dict: Visited documents and write operations (applied, or planned in a dry run)
+    """
+    db = get_db()
+    collection = db[migration.collection]
+    checkpoints = db.migrations
+
+    checkpoint = None if restart else checkpoints.find_one({'_id': migration.name})
+    if checkpoint and checkpoint.get('status') == 'completed' and not dry_run:
+        logger.info("Migration %s already completed", migration.name)
+        return {'visited': 0, 'writes': 0}
+
+    last_id = checkpoint.get('lastId') if checkpoint else None
+    total = collection.count_documents(migration.query)
+    visited = checkpoint.get('visited', 0) if checkpoint else 0
+    writes = checkpoint.get('writes', 0) if checkpoint else 0
+    next_report = visited + PROGRESS_EVERY
+
+    if not dry_run:
+        checkpoints.update_one(
+            {'_id': migration.name},
+            {'$set': {'status': 'running', 'updatedAt': datetime.now(UTC)},
+             '$setOnInsert': {'startedAt': datetime.now(UTC)}},
+            upsert=True
+        )
+
+    logger.info("Running migration %s%s (%d documents)", migration.name, ' [dry run]' if dry_run else '', total)
+    while True:
+        query = dict(migration.query)
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        docs = list(collection.find(query, migration.projection).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+
+        started = time.monotonic()
+        operations = migration.transform_batch(db, docs)
+        if operations and not dry_run:
+            result = collection.bulk_write(operations, ordered=False)
+            writes += result.modified_count + result.upserted_count + result.inserted_count + result.deleted_count
+        elif dry_run:
+            writes += len(operations)
+
+        last_id = docs[-1]['_id']
+        visited += len(docs)
+
+        if not dry_run:
+            checkpoints.update_one(
+                {'_id': migration.name},
+                {'$set': {'lastId': last_id, 'visited': visited, 'writes': writes, 'updatedAt': datetime.now(UTC)}}
+            )
+
+        if visited >= next_report:
+            logger.info("%s: %d/%d documents (%.1f%%), %d writes",
+                        migration.name, visited, total, 100 * visited / max(total, 1), writes)
+            next_report = visited + PROGRESS_EVERY
+
+        # Throttle on write volume rather than batches: no-op batches cost little
+        if max_writes_per_second and operations:
+            delay = len(operations) / max_writes_per_second - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+    if not dry_run:
+        checkpoints.update_one(
+            {'_id': migration.name},
+            {'$set': {'status': 'completed', 'completedAt': datetime.now(UTC), 'updatedAt': datetime.now(UTC)}}
+        )
+
+    logger.info("Migration %s finished: %d documents visited, %d %s",
+                migration.name, visited, writes, 'planned writes' if dry_run else 'writes')
+    return {'visited': visited, 'writes': writes}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run resumable bulk migrations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List registered migrations")
+    run_parser = subparsers.add_parser('run', help="Run a migration")
+    run_parser.add_argument('name', choices=sorted(MIGRATIONS))
+    run_parser.add_argument('--dry-run', action='store_true', help="Report changes without writing")
+    run_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    run_parser.add_argument('--max-writes-per-second', type=float, default=None)
+    run_parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name, migration in sorted(MIGRATIONS.items()):
+            print(f"{name}: {migration.description}")
+        return
+
+    run_migration(
+        MIGRATIONS[args.name],
+        batch_size=args.batch_size,
+        max_writes_per_second=args.max_writes_per_second,
+        dry_run=args.dry_run,
+        restart=args.restart
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Deliver outbox events to recipient webhooks
+
+Completed regards carry an embedded outbox entry (see api/models/outbox.py).
+The dispatcher leases due entries in batches, posts each event to the
+recipient's webhooks from a thread pool, and records the outcome in one
+bulk write per batch. Deliveries to the same host are limited to
+OUTBOX_PER_DESTINATION_CONCURRENCY at a time, failed events are retried with
+exponential backoff, and webhooks already notified are skipped on retries.
+Destination hosts are resolved and checked before every delivery, and the
+connection goes to the checked address (see post_webhook).
+
+Every request is signed (X-DropRegards-Signature, see api/utils/webhooks.py).
+`sink` runs a local HTTP receiver that prints and verifies deliveries, for
+trying the pipeline end to end with WEBHOOK_ALLOW_INSECURE=true.
+
+Usage:
+    python -m api.jobs.outbox run [--once] [--batch-size N] [--workers N]
+    python -m api.jobs.outbox sink [--port 8099] [--secret SECRET] [--status 200]
+"""
+import argparse
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse
+from api.models.outbox import claim_due_events, record_delivery_results
+from api.models.webhook import get_webhooks_by_wallets
+from api.utils.webhooks import (
+    build_request, post_webhook, verify_signature, UnsafeDestination, SIGNATURE_HEADER, EVENT_ID_HEADER
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 8))
+# Concurrent deliveries to one host
+OUTBOX_PER_DESTINATION_CONCURRENCY = int(os.environ.get('OUTBOX_PER_DESTINATION_CONCURRENCY', 2))
+# HTTP timeout of one delivery (seconds)
+DELIVERY_TIMEOUT = float(os.environ.get('OUTBOX_DELIVERY_TIMEOUT', 10))
+# How long a claimed batch is reserved; must cover the slowest batch (seconds)
+OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', 300))
+# Wait between polls when nothing is due (seconds)
+POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 2))
+
+def _deliver_lane(deliveries):
+    """
+    Post a lane of deliveries to one host, one at a time
+
+    After a network failure the rest of the lane is skipped: the host is
+    probably down, and waiting out every timeout would hold the thread.
+
+    Returns:
+        list: (regard_id, webhook_id, error or None) per delivery
+    """
+    outcomes = []
+    host_error = None
+    for regard, webhook in deliveries:
+        if host_error:
+            outcomes.append((regard['_id'], webhook['_id'], f"skipped, host unavailable: {host_error}"))
+            continue
+        try:
+            body, headers = build_request(webhook, regard, regard['outbox']['event'])
+            post_webhook(webhook['url'], body, headers, DELIVERY_TIMEOUT)
+            outcomes.append((regard['_id'], webhook['_id'], None))
+        except (OSError, UnsafeDestination) as e:
+            # Timeouts, connection and TLS errors, or a host now resolving to a rejected address
+            host_error = str(e)[:200]
+            outcomes.append((regard['_id'], webhook['_id'], host_error))
+        except Exception as e:
+            outcomes.append((regard['_id'], webhook['_id'], str(e)[:200]))
+    return outcomes
+
+def dispatch_batch(pool, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Claim and deliver one batch of due events
+
+    Deliveries are grouped by destination host and each host gets at most
+    OUTBOX_PER_DESTINATION_CONCURRENCY lanes, so slow or unreachable hosts
+    hold a bounded share of the pool and can't stall the others.
+
+    Returns:
+        int: Number of events processed
+    """
+    lease_id, regards = claim_due_events(batch_size, OUTBOX_LEASE_SECONDS)
+    if not regards:
+        return 0
+
+    webhooks = get_webhooks_by_wallets([regard['recipient']['walletAddress'] for regard in regards])
+
+    by_host = defaultdict(list)
+    for regard in regards:
+        already_delivered = set(regard['outbox'].get('delivered', []))
+        for webhook in webhooks.get(regard['recipient']['walletAddress'], []):
+            if webhook['_id'] not in already_delivered:
+                by_host[urlparse(webhook['url']).hostname].append((regard, webhook))
+
+    futures = []
+    for deliveries in by_host.values():
+        lanes = min(OUTBOX_PER_DESTINATION_CONCURRENCY, len(deliveries))
+        for lane in range(lanes):
+            futures.append(pool.submit(_deliver_lane, deliveries[lane::lanes]))
+
+    delivered, errors = defaultdict(list), defaultdict(list)
+    for future in futures:
+        for regard_id, webhook_id, error in future.result():
+            if error is None:
+                delivered[regard_id].append(webhook_id)
+            else:
+                errors[regard_id].append(f"{webhook_id}: {error}")
+
+    results = []
+    for regard in regards:
+        attempts = regard['outbox'].get('attempts', 0) + 1
+        regard_errors = errors.get(regard['_id'])
+        results.append((regard['_id'], delivered.get(regard['_id'], []), '; '.join(regard_errors or []) or None, attempts))
+        if regard_errors:
+            logger.warning("Outbox delivery for regard %s failed (attempt %d): %s", regard['_id'], attempts, regard_errors)
+
+    record_delivery_results(results, lease_id)
+    return len(regards)
+
+def run_dispatcher(once=False, batch_size=DEFAULT_BATCH_SIZE, workers=OUTBOX_WORKERS):
+    """
+    Deliver due events until stopped (or until none are due with once=True)
+    """
+    processed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox') as pool:
+        while True:
+            try:
+                count = dispatch_batch(pool, batch_size)
+            except Exception as e:
+                logger.error("Outbox batch failed: %s", str(e))
+                count = 0
+            processed += count
+            if count:
+                continue
+            if once:
+                break
+            time.sleep(POLL_INTERVAL)
+    logger.info("Outbox dispatcher processed %d events", processed)
+    return processed
+
+def run_sink(port, secret=None, status=200):
+    """
+    Serve a local webhook receiver that prints each delivery
+    """
+    class SinkHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            signature = self.headers.get(SIGNATURE_HEADER, '')
+            verified = verify_signature(secret, body, signature) if secret else 'not checked'
+            print(f"{self.path} event={self.headers.get(EVENT_ID_HEADER)} signature={verified}")
+            print(body.decode(errors='replace'))
+            self.send_response(status)
+            self.end_headers()
+
+    server = HTTPServer(('127.0.0.1', port), SinkHandler)
+    print(f"Webhook sink listening on http://127.0.0.1:{port}/ (responding {status})")
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver outbox events to webhooks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Run the dispatcher")
+    run_parser.add_argument('--once', action='store_true', help="Exit when no events are due")
+    run_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    run_parser.add_argument('--workers', type=int, default=OUTBOX_WORKERS)
+    sink_parser = subparsers.add_parser('sink', help="Run a local webhook receiver")
+    sink_parser.add_argument('--port', type=int, default=8099)
+    sink_parser.add_argument('--secret', help="Verify signatures with this webhook secret")
+    sink_parser.add_argument('--status', type=int, default=200, help="Status code to answer with")
+    args = parser.parse_args()
+
+    if args.command == 'sink':
+        run_sink(args.port, args.secret, args.status)
+        return
+
+    run_dispatcher(args.once, args.batch_size, args.workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+On-chain reconciliation for recipient wallets
+
+Walks getSignaturesForAddress for each recipient from a persisted checkpoint,
+so a run only scans signatures that appeared since the previous one. Transfers
+without a matching regard are recorded, and regards stuck in a non-final status
+are completed or failed to match the chain. A regard is only completed when the
+transfer's payer and amount match it.
+
+Usage:
+    python -m api.jobs.reconcile [--wallet ADDRESS] [--rpc-url URL]
+"""
+import argparse
+import logging
+from datetime import datetime, UTC
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from api.db import get_db
+from api.models.regard import on_regard_completed, expiry_for_status
+from api.models.archive import ARCHIVE_COLLECTION
+from api.models.outbox import new_outbox_entry
+from api.utils.solana import get_solana_client, parse_incoming_transfer, SolanaClient, TRANSACTION_UNAVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# Signatures requested per getSignaturesForAddress page (RPC maximum is 1000)
+SIGNATURE_PAGE_SIZE = 1000
+# Transactions fetched per batched getTransaction request and written per bulk_write
+TRANSACTION_BATCH_SIZE = 100
+# Duplicate key error code, raised when /send recorded the regard concurrently
+DUPLICATE_KEY = 11000
+# Largest difference between a regard's amount and the transfer completing it (SOL)
+AMOUNT_TOLERANCE = 0.0001
+# User fields a reconciliation needs
+RECIPIENT_PROJECTION = {'walletAddress': 1, 'username': 1, 'webhookCount': 1}
+
+def _new_signatures(client, wallet_address, until):
+    """
+    Collect signatures newer than `until`, oldest first
+    """
+    signatures = []
+    before = None
+    while True:
+        page = client.get_signatures_for_address(
+            wallet_address, until=until, before=before, limit=SIGNATURE_PAGE_SIZE
+        )
+        signatures.extend(page)
+        if len(page) < SIGNATURE_PAGE_SIZE:
+            break
+        before = page[-1]['signature']
+
+    signatures.reverse()
+    return signatures
+
+def _transfer_matches(regard, transfer):
+    """
+    Check that an on-chain transfer pays what a stored regard claims
+    """
+    return (
+        transfer['sender'] == regard.get('sender', {}).get('walletAddress')
+        and abs(transfer['amount'] - regard.get('amount', 0)) < AMOUNT_TOLERANCE
+    )
+
+def _apply_batch(db, recipient, entries, client):
+    """
+    Reconcile one batch of signature entries against the regards collection
+
+    A regard is only failed when its signature entry carries an error or its
+    fetched transaction pays nothing matching; transactions the RPC could not
+    return are left alone and counted as unfetched.
+
+    Returns:
+        dict: Counts of created, repaired and unfetched regards
+    """
+    signatures = [entry['signature'] for entry in entries]
+    existing = {
+        doc['transactionSignature']: doc
+        for collection in (db[ARCHIVE_COLLECTION], db.regards)
+        for doc in collection.find(
+            # Signatures also list this wallet's outgoing transfers, whose regards belong to other recipients
+            {'transactionSignature': {'$in': signatures}, 'recipient.walletAddress': recipient['walletAddress']},
+            {'transactionSignature': 1, 'status': 1, 'amount': 1, 'sender.walletAddress': 1}
+        )
+    }
+
+    # Only fetch transactions we may have to record or complete
+    to_fetch = [
+        entry['signature'] for entry in entries
+        if entry.get('err') is None and existing.get(entry['signature'], {}).get('status') != 'completed'
+    ]
+    transactions = dict(zip(to_fetch, client.get_transactions(to_fetch)))
+    # Without the transaction nothing can be concluded; these are retried next run
+    unfetched = {
+        signature for signature, transaction in transactions.items()
+        if transaction is None or transaction is TRANSACTION_UNAVAILABLE
+    }
+    transfers = {
+        signature: parse_incoming_transfer(transaction, recipient['walletAddress'])
+        for signature, transaction in transactions.items()
+        if signature not in unfetched
+    }
+
+    sender_wallets = {transfer['sender'] for transfer in transfers.values() if transfer}
+    senders = {
+        user['walletAddress']: user.get('username')
+        for user in db.users.find({'walletAddress': {'$in': list(sender_wallets)}},
+                                  {'walletAddress': 1, 'username': 1})
+    }
+
+    # Only recipients with webhooks get outbox entries
+    notify = bool(recipient.get('webhookCount'))
+    now = datetime.now(UTC)
+    operations = []
+    completed_ids = []
+    for entry in entries:
+        signature = entry['signature']
+        if signature in unfetched:
+            continue
+        regard = existing.get(signature)
+        transfer = transfers.get(signature)
+
+        if regard is None:
+            if not transfer:
+                continue
+            block_time = entry.get('blockTime')
+            regard_id = ObjectId()
+            doc = {
+                '_id': regard_id,
+                'sender': {
+                    'walletAddress': transfer['sender'],
+                    'username': senders.get(transfer['sender'])
+                },
+                'recipient': {
+                    'walletAddress': recipient['walletAddress'],
+                    'username': recipient.get('username')
+                },
+                'amount': transfer['amount'],
+                'message': '',
+                'transactionSignature': signature,
+                'status': 'completed',
+                'source': 'reconciler',
+                'createdAt': datetime.fromtimestamp(block_time, UTC) if block_time else now,
+                'reconciledAt': now
+            }
+            if notify:
+                doc['outbox'] = new_outbox_entry(now=now)
+            operations.append(InsertOne(doc))
+            completed_ids.append(regard_id)
+        elif regard.get('status') != 'completed':
+            if transfer and not _transfer_matches(regard, transfer):
+                # Paid on chain, but not what the regard claims; leave it for a person to look at
+                logger.warning("Regard %s does not match transaction %s (sender %s, amount %s)",
+                               regard['_id'], signature, transfer['sender'], transfer['amount'])
+                continue
+            status = 'completed' if transfer else 'failed'
+            if status == 'completed':
+                update = {'$set': {'status': status, 'reconciledAt': now}, '$unset': {'expiresAt': ''}}
+                if notify:
+                    update['$set']['outbox'] = new_outbox_entry(now=now)
+            else:
+                update = {'$set': {'status': status, 'reconciledAt': now, 'expiresAt': expiry_for_status(status, now)}}
+            operations.append(UpdateOne(
+                {'_id': regard['_id'], 'status': {'$ne': 'completed'}},
+                update
+            ))
+            if status == 'completed':
+                completed_ids.append(regard['_id'])
+
+    if not operations:
+        return {'created': 0, 'repaired': 0, 'unfetched': len(unfetched)}
+
+    try:
+        result = db.regards.bulk_write(operations, ordered=False)
+        created, repaired = result.inserted_count, result.modified_count
+    except BulkWriteError as e:
+        # Regards recorded by /send in the meantime are already correct
+        if any(error['code'] != DUPLICATE_KEY for error in e.details['writeErrors']):
+            raise
+        created, repaired = e.details['nInserted'], e.details['nModified']
+
+    # Feed newly completed regards into derived data (rollups, stats). Inserts
+    # that lost a race with /send were never written, so they are not found here.
+    for regard in db.regards.find({'_id': {'$in': completed_ids}, 'reconciledAt': now}):
+        on_regard_completed(regard)
+
+    return {'created': created, 'repaired': repaired, 'unfetched': len(unfetched)}
+
+def reconcile_wallet(recipient, client=None):
+    """
+    Reconcile one recipient wallet from its checkpoint up to the newest finalized signature
+
+    Args:
+        recipient (dict): User document with walletAddress, username and webhookCount
+        client (SolanaClient): RPC client (the shared client if None)
+
+    Returns:
+        dict: Counts of scanned signatures, created / repaired regards and
+              transactions that could not be fetched (retried on the next run)
+    """
+    db = get_db()
+    client = client or get_solana_client()
+    wallet_address = recipient['walletAddress']
+
+    checkpoint = db.reconcile_checkpoints.find_one({'walletAddress': wallet_address}) or {}
+    entries = _new_signatures(client, wallet_address, checkpoint.get('lastSignature'))
+
+    summary = {'scanned': len(entries), 'created': 0, 'repaired': 0, 'unfetched': 0}
+    for start in range(0, len(entries), TRANSACTION_BATCH_SIZE):
+        batch = entries[start:start + TRANSACTION_BATCH_SIZE]
+        counts = _apply_batch(db, recipient, batch, client)
+        summary['created'] += counts['created']
+        summary['repaired'] += counts['repaired']
+
+        if counts['unfetched']:
+            # Keep the checkpoint before this batch so the next run fetches it again
+            summary['unfetched'] += counts['unfetched']
+            logger.warning("Stopping at %s: %d transactions could not be fetched",
+                           wallet_address, counts['unfetched'])
+            break
+
+        # Advance after every batch so an interrupted run resumes where it stopped
+        db.reconcile_checkpoints.update_one(
+            {'walletAddress': wallet_address},
+            {'$set': {'lastSignature': batch[-1]['signature'], 'updatedAt': datetime.now(UTC)}},
+            upsert=True
+        )
+
+    return summary
+
+def reconcile_all(client=None):
+    """
+    Reconcile every user's wallet
+
+    Returns:
+        dict: Totals across all wallets
+    """
+    db = get_db()
+    totals = {'wallets': 0, 'scanned': 0, 'created': 0, 'repaired': 0, 'unfetched': 0}
+    users = db.users.find({}, RECIPIENT_PROJECTION).sort('_id', 1)
+    for user in users:
+        try:
+            summary = reconcile_wallet(user, client)
+        except Exception as e:
+            logger.error("Reconciliation failed for %s: %s", user['walletAddress'], str(e))
+            continue
+        totals['wallets'] += 1
+        for key in ('scanned', 'created', 'repaired', 'unfetched'):
+            totals[key] += summary[key]
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile regards with on-chain transfers")
+    parser.add_argument('--wallet', help="Only reconcile this recipient wallet")
+    parser.add_argument('--rpc-url', help="Use this RPC endpoint instead of the configured pool")
+    args = parser.parse_args()
+
+    client = SolanaClient([args.rpc_url]) if args.rpc_url else None
+    if args.wallet:
+        user = get_db().users.find_one({'walletAddress': args.wallet}, RECIPIENT_PROJECTION)
+        summary = reconcile_wallet(user or {'walletAddress': args.wallet}, client)
+    else:
+        summary = reconcile_all(client)
+    logger.info("Reconciliation finished: %s", summary)
+
+if __name__ == '__main__':
+    main()
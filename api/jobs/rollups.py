@@ -0,0 +1,36 @@
+"""
+Rebuild the daily regard rollups from the regards collection and its archive
+
+Buckets are normally maintained as regards complete; run this after a
+backfill, a reconciliation or a change to the bucket schema. Limit the run
+with --since/--until to rebuild only the days a backfill touched.
+
+Usage:
+    python -m api.jobs.rollups [--wallet ADDRESS] [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+"""
+import argparse
+import logging
+from datetime import datetime, UTC
+from api.models.rollup import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+def _parse_day(value):
+    """
+    Parse an ISO date (or datetime) argument as UTC
+    """
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the daily regard rollups")
+    parser.add_argument('--wallet', help="Only rebuild this recipient's buckets")
+    parser.add_argument('--since', type=_parse_day, help="First day to rebuild (inclusive)")
+    parser.add_argument('--until', type=_parse_day, help="Rebuild days before this date (exclusive)")
+    args = parser.parse_args()
+
+    buckets = rebuild_rollups(args.wallet, since=args.since, until=args.until)
+    logger.info("Daily rollups rebuilt: %d buckets in range", buckets)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Rebuild sender totals and sender/recipient pairs from the regards collection
+and its archive
+
+Stats are normally maintained as regards complete; run this once on a
+deployment that had regards before sender stats existed, and after a
+backfill or a reconciliation.
+
+Usage:
+    python -m api.jobs.sender_stats [--wallet ADDRESS]
+"""
+import argparse
+import logging
+from api.models.sender_stats import rebuild_sender_stats
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild sender stats")
+    parser.add_argument('--wallet', help="Only rebuild this sender's stats")
+    args = parser.parse_args()
+
+    rebuild_sender_stats(args.wallet)
+    logger.info("Sender stats rebuilt for %s", args.wallet or "all senders")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""
+Rebuild the hourly trending buckets from the regards collection
+
+Buckets are normally maintained as regards complete; run this after a
+backfill, a reconciliation or a change to the bucket schema.
+
+Usage:
+    python -m api.jobs.trending
+"""
+import logging
+from api.models.trending import rebuild_trending_buckets
+
+logger = logging.getLogger(__name__)
+
+def main():
+    buckets = rebuild_trending_buckets()
+    logger.info("Trending buckets rebuilt: %d buckets in the retention period", buckets)
+
+if __name__ == '__main__':
+    main()
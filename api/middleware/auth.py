@@ -5,6 +5,38 @@ import os
 from datetime import datetime
 from api.models.user import find_user_by_wallet
 
+def get_bearer_token():
+    """
+    Extract the token from an "Authorization: Bearer <token>" header
+    
+    Returns:
+        str: The token, or None if the header is missing or malformed
+    """
+    auth_header = request.headers.get('Authorization')
+    if auth_header:
+        parts = auth_header.split()
+        if len(parts) == 2 and parts[0].lower() == 'bearer':
+            return parts[1]
+    return None
+
+def get_token_wallet():
+    """
+    Get the wallet address from the request's JWT without any database access
+    
+    Returns:
+        str: Wallet address from a valid token, or None
+    """
+    token = get_bearer_token()
+    if not token:
+        return None
+    
+    try:
+        secret_key = os.environ.get('JWT_SECRET_KEY', 'dev_secret_key')
+        payload = jwt.decode(token, secret_key, algorithms=['HS256'])
+        return payload.get('sub')
+    except jwt.InvalidTokenError:
+        return None
+
 def token_required(f):
     """
     Decorator to make a route require a valid JWT token
@@ -17,15 +49,7 @@ def token_required(f):
     """
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Check if Authorization header is present
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            # Extract token from "Bearer <token>"
-            parts = auth_header.split()
-            if len(parts) == 2 and parts[0].lower() == 'bearer':
-                token = parts[1]
+        token = get_bearer_token()
         
         if not token:
             return jsonify({
@@ -0,0 +1,111 @@
+from flask import g, jsonify, request, current_app
+import contextvars
+import logging
+import os
+import time
+import pymongo
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Default time budget of a request in seconds (REQUEST_DEADLINE_SECONDS)
+DEFAULT_BUDGET = float(os.environ.get('REQUEST_DEADLINE_SECONDS', 10))
+
+# Monotonic deadline of the current request; a context variable (rather than
+# flask.g) so it can be carried into worker threads with contextvars.copy_context()
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+class DeadlineExceeded(Exception):
+    """Raised when the current request has used up its time budget"""
+
+def with_deadline(seconds):
+    """
+    Decorator overriding the time budget of a route
+
+    Args:
+        seconds (float): Budget in seconds, or None for no deadline (e.g. streaming exports)
+    """
+    def decorator(f):
+        # functools.wraps copies __dict__, so outer decorators keep the attribute
+        f.deadline_budget = seconds
+        return f
+    return decorator
+
+def remaining_time():
+    """
+    Get the time left in the current request's budget
+
+    Returns:
+        float: Seconds left, or None when no deadline applies (jobs, exempt routes)
+
+    Raises:
+        DeadlineExceeded: If the budget is already spent
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return remaining
+
+def bounded_timeout(timeout):
+    """
+    Cap a timeout at the time left in the current request's budget
+    """
+    remaining = remaining_time()
+    return timeout if remaining is None else min(timeout, remaining)
+
+def _deadline_response():
+    response = jsonify({
+        "error": "Service Unavailable",
+        "message": "The request could not be completed in time. Please try again."
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def init_deadlines(app):
+    """
+    Give every request a time budget that reaches MongoDB and Solana RPC calls
+
+    Within the budget, pymongo operations run under pymongo.timeout() (client-side
+    operation timeouts, sent to the server as maxTimeMS) and RPC calls use the
+    remaining time as their HTTP timeout. An exhausted budget becomes a fast 503.
+    """
+    @app.before_request
+    def start_deadline():
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'deadline_budget', DEFAULT_BUDGET)
+        if budget is None:
+            return
+
+        g.deadline_token = _deadline.set(time.monotonic() + budget)
+        g.mongo_timeout = pymongo.timeout(budget)
+        g.mongo_timeout.__enter__()
+
+    @app.teardown_request
+    def end_deadline(error=None):
+        mongo_timeout = g.pop('mongo_timeout', None)
+        if mongo_timeout is not None:
+            mongo_timeout.__exit__(None, None, None)
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            _deadline.reset(token)
+
+    @app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(error):
+        logger.warning("Deadline exceeded on %s %s", request.method, request.path)
+        return _deadline_response()
+
+    @app.errorhandler(PyMongoError)
+    def mongo_error(error):
+        if error.timeout:
+            logger.warning("MongoDB timeout on %s %s: %s", request.method, request.path, str(error))
+            return _deadline_response()
+        logger.error("MongoDB error on %s %s: %s", request.method, request.path, str(error))
+        return jsonify({
+            "error": "Internal Server Error",
+            "message": "An unexpected error occurred."
+        }), 500
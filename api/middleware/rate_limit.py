@@ -0,0 +1,245 @@
+from flask import request, jsonify
+from functools import wraps
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from api.middleware.auth import get_token_wallet
+
+logger = logging.getLogger(__name__)
+
+# Memory backend drops idle buckets once it tracks more keys than this
+MAX_MEMORY_BUCKETS = 100_000
+# Minimum seconds between two prunes, so a flood of new keys doesn't make
+# every request walk all buckets
+PRUNE_INTERVAL = 10
+
+
+class MemoryBackend:
+    """
+    Token buckets kept in this process
+
+    Limits are per worker: with N gunicorn workers a client can get up to N
+    times the configured rate. Use the SQLite backend to share buckets.
+    """
+
+    def __init__(self):
+        # key -> (tokens, updated, capacity, refill_rate)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        """
+        Take `cost` tokens from a bucket
+
+        Args:
+            key (str): Bucket key
+            capacity (float): Bucket size (burst)
+            refill_rate (float): Tokens added per second
+            cost (float): Tokens this request needs
+
+        Returns:
+            tuple: (allowed, retry_after_seconds)
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))[:2]
+            tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0
+            else:
+                allowed, retry_after = False, (cost - tokens) / refill_rate
+            self._buckets[key] = (tokens, now, capacity, refill_rate)
+
+            if len(self._buckets) > MAX_MEMORY_BUCKETS and now - self._last_prune >= PRUNE_INTERVAL:
+                self._prune(now)
+
+        return allowed, retry_after
+
+    def _prune(self, now):
+        # A bucket that would be full again carries no state worth keeping;
+        # each bucket refills at the rate of the route that created it
+        self._last_prune = now
+        self._buckets = {
+            key: value for key, value in self._buckets.items()
+            if value[0] + (now - value[1]) * value[3] < value[2]
+        }
+
+
+class SQLiteBackend:
+    """
+    Token buckets in a SQLite file shared by every worker on the host
+
+    Each consume is a single IMMEDIATE transaction, so concurrent workers
+    serialize on the bucket update and limits hold across processes. Every
+    row stores when its bucket will be full again (full_at); rows past that
+    point are deleted at most once per PRUNE_INTERVAL per process.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._create_schema(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_schema(self, conn):
+        # Serialized so concurrent workers don't both add the column
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, '
+                'full_at REAL NOT NULL DEFAULT 0)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(buckets)')]
+            if 'full_at' not in columns:
+                # Files created before pruning: their rows become prunable at once
+                conn.execute('ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        """
+        Take `cost` tokens from a bucket (see MemoryBackend.consume)
+        """
+        # Wall-clock time: monotonic clocks are not comparable across processes
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0
+            else:
+                allowed, retry_after = False, (cost - tokens) / refill_rate
+
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (capacity - tokens) / refill_rate)
+            )
+
+            if now - self._last_prune >= PRUNE_INTERVAL:
+                # A bucket that would be full again carries no state worth keeping
+                self._last_prune = now
+                conn.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return allowed, retry_after
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Get the configured rate limit backend
+
+    RATE_LIMIT_BACKEND is either "memory" (default) or "sqlite:///<path>".
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is None:
+            spec = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+            if spec.startswith('sqlite:///'):
+                _backend = SQLiteBackend(spec[len('sqlite:///'):])
+            else:
+                if spec != 'memory':
+                    logger.warning("Unknown RATE_LIMIT_BACKEND %s, using memory", spec)
+                _backend = MemoryBackend()
+    return _backend
+
+def get_client_ip():
+    """
+    Get the client IP, honouring X-Forwarded-For only behind a trusted proxy
+    """
+    if os.environ.get('RATE_LIMIT_TRUST_PROXY', 'false').lower() == 'true':
+        forwarded = request.headers.get('X-Forwarded-For')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+def _wallet_from_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        # Missing, invalid or non-object JSON (a list, a string); the route rejects it
+        return None
+    wallet_address = data.get('walletAddress')
+    return wallet_address if isinstance(wallet_address, str) else None
+
+def rate_limit(scope, per_ip=None, per_wallet=None, wallet_from='body'):
+    """
+    Decorator applying per-IP and per-wallet token buckets to a route
+
+    Place it above @token_required so rejected requests never reach the
+    database or the Solana RPC.
+
+    Args:
+        scope (str): Name shared by the buckets of this route
+        per_ip (tuple): (requests, seconds) allowed per client IP
+        per_wallet (tuple): (requests, seconds) allowed per wallet address
+        wallet_from (str): "body" (walletAddress in the JSON body) or "token" (JWT subject)
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'true':
+                return f(*args, **kwargs)
+
+            checks = []
+            if per_ip:
+                checks.append((f"{scope}:ip:{get_client_ip()}", per_ip))
+            if per_wallet:
+                wallet_address = get_token_wallet() if wallet_from == 'token' else _wallet_from_body()
+                if wallet_address:
+                    checks.append((f"{scope}:wallet:{wallet_address}", per_wallet))
+
+            for key, (requests_allowed, seconds) in checks:
+                try:
+                    allowed, retry_after = get_backend().consume(
+                        key, requests_allowed, requests_allowed / seconds
+                    )
+                except Exception as e:
+                    # Fail open: an unavailable limiter must not take the API down
+                    logger.error("Rate limit backend error: %s", str(e))
+                    break
+
+                if not allowed:
+                    response = jsonify({
+                        'error': 'Too many requests',
+                        'message': 'Rate limit exceeded. Please try again later.'
+                    })
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+                    return response
+
+            return f(*args, **kwargs)
+
+        return decorated
+    return decorator
@@ -0,0 +1,19 @@
+# Archive of completed regards (collection: regards_archive), same schema as
+# regards. The archive job writes each copy with archivePending: true and
+# removes the flag once the hot original is deleted (see api/jobs/archive.py).
+# Readers skip flagged copies, so a regard is never counted in both tiers,
+# even after an interrupted run.
+
+ARCHIVE_COLLECTION = 'regards_archive'
+
+def archive_query(query):
+    """
+    Restrict a regards filter to the archived copies readers may see
+
+    Args:
+        query (dict): Filter also used on the hot collection
+
+    Returns:
+        dict: Filter for the archive collection
+    """
+    return {**query, 'archivePending': {'$exists': False}}
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta, UTC
+from api.db import get_db
+import os
+import random
+from pymongo import UpdateOne
+try:
+    from bson import ObjectId
+except ImportError:
+    # Fallback for various pymongo package configurations
+    from pymongo.bson.objectid import ObjectId
+
+# Outbox entries are embedded in the regard they describe, so recording an
+# event is part of the regard's own insert or status update:
+# regard.outbox = {
+#   event: string,            // "regard.completed"
+#   state: string,            // "pending" until delivered (then removed), "dead" after the last attempt
+#   attempts: number,
+#   nextAttemptAt: datetime,  // due time, pushed forward while leased and between retries
+#   leaseId: string,          // dispatcher batch that holds the event
+#   delivered: [string],      // webhook IDs already notified
+#   lastError: string
+# }
+# Pending entries are found through a partial index on outbox.nextAttemptAt.
+
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 10))
+# Retry delays double from the base up to the cap, with jitter
+OUTBOX_BACKOFF_BASE = timedelta(seconds=int(os.environ.get('OUTBOX_BACKOFF_BASE_SECONDS', 30)))
+OUTBOX_BACKOFF_CAP = timedelta(hours=6)
+
+def new_outbox_entry(event='regard.completed', now=None):
+    """
+    Build the outbox entry stored with a regard
+
+    Returns:
+        dict: Entry due immediately
+    """
+    return {
+        'event': event,
+        'state': 'pending',
+        'attempts': 0,
+        'nextAttemptAt': now or datetime.now(UTC),
+        'delivered': []
+    }
+
+def retry_delay(attempts):
+    """
+    Get the delay before the next attempt after `attempts` failures
+    """
+    delay = min(OUTBOX_BACKOFF_CAP, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1)
+
+def claim_due_events(limit, lease_seconds):
+    """
+    Lease a batch of due outbox events
+
+    Leased events are not due again until the lease expires, so several
+    dispatchers can run at once. An event whose dispatcher dies is retried
+    once its lease expires (delivery is at least once).
+
+    Args:
+        limit (int): Maximum number of events
+        lease_seconds (float): How long the batch is reserved
+
+    Returns:
+        tuple: (lease ID, list of regard documents)
+    """
+    db = get_db()
+    now = datetime.now(UTC)
+    due = {'outbox.state': 'pending', 'outbox.nextAttemptAt': {'$lte': now}}
+
+    ids = [doc['_id'] for doc in db.regards.find(due, {'_id': 1}).sort('outbox.nextAttemptAt', 1).limit(limit)]
+    if not ids:
+        return None, []
+
+    lease_id = str(ObjectId())
+    db.regards.update_many(
+        {**due, '_id': {'$in': ids}},
+        {'$set': {'outbox.leaseId': lease_id, 'outbox.nextAttemptAt': now + timedelta(seconds=lease_seconds)}}
+    )
+    # Events claimed by another dispatcher in between keep that dispatcher's lease
+    return lease_id, list(db.regards.find({'_id': {'$in': ids}, 'outbox.leaseId': lease_id}))
+
+def record_delivery_results(results, lease_id):
+    """
+    Store the outcome of a leased batch
+
+    Args:
+        results (list): (regard_id, delivered webhook IDs, error or None, attempts
+                        including this one) per event
+        lease_id (str): Lease the events were claimed with
+    """
+    db = get_db()
+    now = datetime.now(UTC)
+    operations = []
+    for regard_id, delivered, error, attempts in results:
+        lease = {'_id': regard_id, 'outbox.leaseId': lease_id}
+        if error is None:
+            operations.append(UpdateOne(lease, {'$unset': {'outbox': ''}, '$set': {'notifiedAt': now}}))
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            operations.append(UpdateOne(lease, {
+                '$set': {'outbox.state': 'dead', 'outbox.attempts': attempts, 'outbox.lastError': error},
+                '$addToSet': {'outbox.delivered': {'$each': delivered}},
+                '$unset': {'outbox.leaseId': '', 'outbox.nextAttemptAt': ''}
+            }))
+        else:
+            operations.append(UpdateOne(lease, {
+                '$set': {
+                    'outbox.attempts': attempts,
+                    'outbox.lastError': error,
+                    'outbox.nextAttemptAt': now + retry_delay(attempts)
+                },
+                '$addToSet': {'outbox.delivered': {'$each': delivered}},
+                '$unset': {'outbox.leaseId': ''}
+            }))
+
+    if operations:
+        db.regards.bulk_write(operations, ordered=False)
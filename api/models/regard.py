@@ -1,12 +1,54 @@
-from datetime import datetime, UTC
-from api.db import get_db
+from datetime import datetime, timedelta, UTC
+from api.db import get_db, current_session, ROLE_ANALYTICS
+from api.models.rollup import record_regard_in_rollup
+from api.models.sender_stats import record_regard_in_sender_stats
+from api.models.trending import record_regard_in_trending
+from api.models.outbox import new_outbox_entry
+from api.models.archive import ARCHIVE_COLLECTION, archive_query
+import heapq
+import os
 import pymongo
+import logging
 try:
     from bson import ObjectId
 except ImportError:
     # Fallback for various pymongo package configurations
     from pymongo.bson.objectid import ObjectId
 
+logger = logging.getLogger(__name__)
+
+# Completed regards older than REGARDS_HOT_DAYS are moved to the archive
+# collection by `python -m api.jobs.archive`. The minimum keeps the trending
+# windows inside the hot collection.
+MIN_HOT_DAYS = 45
+REGARDS_HOT_DAYS = max(MIN_HOT_DAYS, int(os.environ.get('REGARDS_HOT_DAYS', 365)))
+# Regards that never complete are removed by the expiresAt TTL index
+PENDING_TTL = timedelta(hours=int(os.environ.get('REGARDS_PENDING_TTL_HOURS', 72)))
+FAILED_TTL = timedelta(days=int(os.environ.get('REGARDS_FAILED_TTL_DAYS', 30)))
+
+# Characters of the message kept in list summaries
+MESSAGE_PREVIEW_LENGTH = 140
+
+# Projection for list views: the server truncates the message and drops NFT
+# sub-documents, so pages stay small however long the messages are
+REGARD_SUMMARY_PROJECTION = {
+    'sender.walletAddress': 1,
+    'sender.username': 1,
+    'recipient.username': 1,
+    'amount': 1,
+    'includesNft': 1,
+    'status': 1,
+    'createdAt': 1,
+    'message': {'$substrCP': [{'$ifNull': ['$message', '']}, 0, MESSAGE_PREVIEW_LENGTH]},
+    'messageTruncated': {'$gt': [{'$strLenCP': {'$ifNull': ['$message', '']}}, MESSAGE_PREVIEW_LENGTH]}
+}
+
+# Sent-side list views show who received each regard
+SENT_SUMMARY_PROJECTION = {
+    **REGARD_SUMMARY_PROJECTION,
+    'recipient.walletAddress': 1
+}
+
 # Regard schema:
 # {
 #   _id: ObjectId,
@@ -22,15 +64,58 @@ except ImportError:
 #   message: string,
 #   transactionSignature: string,
 #   status: string, // "pending", "completed", "failed"
-#   createdAt: datetime
+#   createdAt: datetime,
+#   expiresAt: datetime, // only while not completed (TTL)
+#   outbox: object      // pending notification, see api/models/outbox.py
 # }
+#
+# Completed regards past REGARDS_HOT_DAYS live in regards_archive with the
+# same schema (see api/models/archive.py). Read functions below continue into
+# the archive transparently.
+
+def expiry_for_status(status, now=None):
+    """
+    Get the TTL expiry of a regard in the given status
+
+    Returns:
+        datetime: When the regard may be deleted, or None for completed regards
+    """
+    now = now or datetime.now(UTC)
+    if status == 'pending':
+        return now + PENDING_TTL
+    if status == 'failed':
+        return now + FAILED_TTL
+    return None
 
-def create_regard(regard_data):
+def _find_across_tiers(db, query, projection, sort, offset, limit):
+    """
+    Run a paged find on the hot collection, continuing into the archive
+
+    Archived regards are all older than the hot ones, so for newest-first
+    sorts the archive simply follows the hot results.
+    """
+    docs = list(db.regards.find(query, projection, session=current_session())
+                .sort(sort).skip(offset).limit(limit))
+    
+    if len(docs) < limit:
+        archive_offset = 0
+        if not docs and offset:
+            # The page starts past the hot results
+            archive_offset = max(0, offset - db.regards.count_documents(query, session=current_session()))
+        docs += list(db[ARCHIVE_COLLECTION].find(archive_query(query), projection, session=current_session())
+                     .sort(sort).skip(archive_offset).limit(limit - len(docs)))
+    
+    for doc in docs:
+        doc['_id'] = str(doc['_id'])
+    return docs
+
+def create_regard(regard_data, notify=False):
     """
     Create a new regard in the database
     
     Args:
         regard_data (dict): Regard data including sender, recipient, amount, message, etc.
+        notify (bool): Queue webhook delivery (when the recipient has webhooks)
         
     Returns:
         dict: Created regard document
@@ -40,16 +125,50 @@ def create_regard(regard_data):
     
     # Add timestamp
     regard_data['createdAt'] = datetime.now(UTC)
+    expires_at = expiry_for_status(regard_data.get('status'), regard_data['createdAt'])
+    if expires_at:
+        regard_data['expiresAt'] = expires_at
+    if regard_data.get('status') == 'completed' and notify:
+        # Written with the regard itself; webhooks are sent later by the dispatcher
+        regard_data['outbox'] = new_outbox_entry(now=regard_data['createdAt'])
     
     # Insert document
-    result = regard_collection.insert_one(regard_data)
+    result = regard_collection.insert_one(regard_data, session=current_session())
     regard_data['_id'] = str(result.inserted_id)
     
+    if regard_data.get('status') == 'completed':
+        on_regard_completed(regard_data)
+    
     return regard_data
 
+def on_regard_completed(regard):
+    """
+    Update derived data (analytics rollups, sender stats, trending) for a regard that reached "completed"
+    
+    Derived data can always be rebuilt from the regards collection, so failures
+    here are logged rather than failing the write that triggered them.
+    
+    Args:
+        regard (dict): Completed regard document
+    """
+    try:
+        record_regard_in_rollup(regard)
+    except Exception as e:
+        logger.error("Error updating regard rollups for %s: %s", regard.get('_id'), str(e))
+    
+    try:
+        record_regard_in_sender_stats(regard)
+    except Exception as e:
+        logger.error("Error updating sender stats for %s: %s", regard.get('_id'), str(e))
+    
+    try:
+        record_regard_in_trending(regard)
+    except Exception as e:
+        logger.error("Error updating trending buckets for %s: %s", regard.get('_id'), str(e))
+
 def get_regards_by_recipient(wallet_address, limit=10, offset=0):
     """
-    Get regards received by a user
+    Get summaries of regards received by a user
     
     Args:
         wallet_address (str): Recipient wallet address
@@ -57,22 +176,141 @@ def get_regards_by_recipient(wallet_address, limit=10, offset=0):
         offset (int): Number of records to skip
         
     Returns:
-        list: List of regard documents
+        list: Regard summaries (see REGARD_SUMMARY_PROJECTION); use
+              get_regard_by_id for the full document
+    """
+    db = get_db()
+    
+    return _find_across_tiers(
+        db,
+        {'recipient.walletAddress': wallet_address, 'status': 'completed'},
+        REGARD_SUMMARY_PROJECTION,
+        [('createdAt', pymongo.DESCENDING)],
+        offset,
+        limit
+    )
+
+def get_regards_by_sender(wallet_address, limit=10, after=None):
+    """
+    Get summaries of regards sent by a user, newest first, with keyset pagination
+    
+    Served entirely by the (sender.walletAddress, status, createdAt, _id)
+    index: no documents are skipped and nothing is sorted in memory.
+    
+    Args:
+        wallet_address (str): Sender wallet address
+        limit (int): Maximum number of records to return
+        after (tuple): (createdAt, _id) of the last regard of the previous page
+        
+    Returns:
+        list: Regard summaries (see SENT_SUMMARY_PROJECTION)
+    """
+    db = get_db()
+    
+    query = {'sender.walletAddress': wallet_address, 'status': 'completed'}
+    if after:
+        created_at, last_id = after
+        # One range on createdAt keeps the index order usable for the sort;
+        # ties on createdAt already returned are filtered out on the index keys
+        query['createdAt'] = {'$lte': created_at}
+        query['$nor'] = [{'createdAt': created_at, '_id': {'$gte': ObjectId(last_id)}}]
+    
+    return _find_across_tiers(
+        db,
+        query,
+        SENT_SUMMARY_PROJECTION,
+        [('createdAt', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)],
+        0,
+        limit
+    )
+
+def search_regards_by_recipient(wallet_address, text, limit=10, after=None):
+    """
+    Search the messages of regards received by a user, best matches first
+    
+    Uses the (recipient.walletAddress, message text, status) index, so only
+    the recipient's own index entries matching the search terms are read.
+    Results are ordered by (score, _id) for keyset pagination.
+    
+    Args:
+        wallet_address (str): Recipient wallet address
+        text (str): Search terms (MongoDB $text syntax: "phrases" and -negations)
+        limit (int): Maximum number of records to return
+        after (tuple): (score, _id) of the last regard of the previous page
+        
+    Returns:
+        list: Regard summaries (see REGARD_SUMMARY_PROJECTION) with a score
     """
     db = get_db()
     regard_collection = db.regards
     
-    cursor = regard_collection.find(
-        {'recipient.walletAddress': wallet_address, 'status': 'completed'}
-    ).sort('createdAt', pymongo.DESCENDING).skip(offset).limit(limit)
+    pipeline = [
+        {'$match': {
+            'recipient.walletAddress': wallet_address,
+            'status': 'completed',
+            '$text': {'$search': text}
+        }},
+        {'$addFields': {'score': {'$meta': 'textScore'}}}
+    ]
+    if after:
+        score, last_id = after
+        pipeline.append({'$match': {'$or': [
+            {'score': {'$lt': score}},
+            {'score': score, '_id': {'$lt': ObjectId(last_id)}}
+        ]}})
+    pipeline += [
+        {'$sort': {'score': -1, '_id': -1}},
+        {'$limit': limit},
+        {'$project': {**REGARD_SUMMARY_PROJECTION, 'score': 1}}
+    ]
     
     result = []
-    for doc in cursor:
+    for doc in regard_collection.aggregate(pipeline, session=current_session()):
         doc['_id'] = str(doc['_id'])
         result.append(doc)
     
     return result
 
+def iter_regards_by_recipient(wallet_address, after_id=None, batch_size=500):
+    """
+    Stream every completed regard received by a user in _id order
+    
+    Merges one server-side cursor per tier (hot and archive), each fetched in
+    bounded batches, so memory use stays constant regardless of history size.
+    Reads go to the analytics role so long exports stay off the primary.
+    
+    Args:
+        wallet_address (str): Recipient wallet address
+        after_id (str): Only yield regards with an _id greater than this one
+        batch_size (int): Number of documents fetched per round trip
+        
+    Yields:
+        dict: Regard documents
+    """
+    db = get_db(ROLE_ANALYTICS)
+    
+    query = {'recipient.walletAddress': wallet_address, 'status': 'completed'}
+    if after_id:
+        query['_id'] = {'$gt': ObjectId(after_id)}
+    
+    cursors = [
+        collection.find(collection_query, session=current_session()).sort('_id', pymongo.ASCENDING).batch_size(batch_size)
+        for collection, collection_query in ((db.regards, query), (db[ARCHIVE_COLLECTION], archive_query(query)))
+    ]
+    
+    try:
+        last_id = None
+        for doc in heapq.merge(*cursors, key=lambda doc: doc['_id']):
+            # A regard being archived can briefly exist in both tiers
+            if doc['_id'] == last_id:
+                continue
+            last_id = doc['_id']
+            doc['_id'] = str(doc['_id'])
+            yield doc
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
 def get_regard_stats(wallet_address):
     """
     Get statistics for regards received by a user
@@ -83,12 +321,14 @@ def get_regard_stats(wallet_address):
     Returns:
         dict: Statistics including totalSol, totalRegards, uniqueSenders
     """
-    db = get_db()
+    db = get_db(ROLE_ANALYTICS)
     regard_collection = db.regards
     
     # Pipeline for MongoDB aggregation
+    match = {'recipient.walletAddress': wallet_address, 'status': 'completed'}
     pipeline = [
-        {'$match': {'recipient.walletAddress': wallet_address, 'status': 'completed'}},
+        {'$match': match},
+        {'$unionWith': {'coll': ARCHIVE_COLLECTION, 'pipeline': [{'$match': archive_query(match)}]}},
         {'$group': {
             '_id': None,
             'totalSol': {'$sum': '$amount'},
@@ -103,16 +343,39 @@ def get_regard_stats(wallet_address):
         }}
     ]
     
-    result = list(regard_collection.aggregate(pipeline))
+    result = list(regard_collection.aggregate(pipeline, session=current_session()))
     return result[0] if result else {
         'totalSol': 0,
         'totalRegards': 0,
         'uniqueSenders': 0
     }
 
+def get_nft_regards_by_recipient(wallet_address, limit=50, offset=0):
+    """
+    Get the NFT certificates a user received
+    
+    Args:
+        wallet_address (str): Recipient wallet address
+        limit (int): Maximum number of records to return
+        offset (int): Number of records to skip
+        
+    Returns:
+        list: Regards with their nft sub-documents (messages excluded)
+    """
+    db = get_db()
+    
+    return _find_across_tiers(
+        db,
+        {'recipient.walletAddress': wallet_address, 'status': 'completed', 'includesNft': True},
+        {'nft': 1, 'sender.username': 1, 'amount': 1, 'createdAt': 1},
+        [('createdAt', pymongo.DESCENDING)],
+        offset,
+        limit
+    )
+
 def get_regard_by_id(regard_id):
     """
-    Get a regard by ID
+    Get a regard by ID, from the hot collection or the archive
     
     Args:
         regard_id (str): Regard ID
@@ -123,7 +386,9 @@ def get_regard_by_id(regard_id):
     db = get_db()
     regard_collection = db.regards
     
-    regard = regard_collection.find_one({'_id': ObjectId(regard_id)})
+    regard = regard_collection.find_one({'_id': ObjectId(regard_id)}, session=current_session())
+    if not regard:
+        regard = db[ARCHIVE_COLLECTION].find_one({'_id': ObjectId(regard_id)}, session=current_session())
     if regard:
         regard['_id'] = str(regard['_id'])
     
@@ -0,0 +1,206 @@
+from datetime import datetime, timedelta, UTC
+from api.db import get_db, current_session, ROLE_ANALYTICS
+from api.models.archive import ARCHIVE_COLLECTION, archive_query
+import pymongo
+
+# Daily rollup schema (collection: regard_daily):
+# {
+#   _id: ObjectId,
+#   recipient: string,        // recipient wallet address
+#   day: datetime,            // midnight UTC of the bucket
+#   count: number,            // completed regards received that day
+#   totalSol: number,         // SOL received that day
+#   senders: [string],        // distinct sender wallets that day
+#   uniqueSenders: number,
+#   updatedAt: datetime
+# }
+
+def _day_start(moment):
+    """
+    Truncate a datetime to midnight UTC
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return moment.astimezone(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def record_regard_in_rollup(regard):
+    """
+    Add a completed regard to its recipient's daily bucket
+
+    Args:
+        regard (dict): Regard document with recipient, sender, amount and createdAt
+    """
+    db = get_db()
+    rollup_collection = db.regard_daily
+
+    sender_wallet = regard.get('sender', {}).get('walletAddress')
+    new_senders = [sender_wallet] if sender_wallet else []
+
+    # Single atomic pipeline update: bump the totals, merge the sender into the
+    # set and keep its cardinality next to it so reads never size arrays
+    rollup_collection.update_one(
+        {
+            'recipient': regard['recipient']['walletAddress'],
+            'day': _day_start(regard.get('createdAt') or datetime.now(UTC))
+        },
+        [
+            {'$set': {
+                'count': {'$add': [{'$ifNull': ['$count', 0]}, 1]},
+                'totalSol': {'$add': [{'$ifNull': ['$totalSol', 0]}, regard.get('amount', 0)]},
+                'senders': {'$setUnion': [{'$ifNull': ['$senders', []]}, new_senders]},
+                'updatedAt': datetime.now(UTC)
+            }},
+            {'$set': {'uniqueSenders': {'$size': '$senders'}}}
+        ],
+        upsert=True,
+        session=current_session()
+    )
+
+def rebuild_rollups(wallet_address=None, since=None, until=None):
+    """
+    Recompute daily buckets from the regards collection and its archive
+
+    Buckets are replaced in place, so the time series stays readable while a
+    rebuild runs. The range is widened to whole UTC days so no bucket is
+    rebuilt from part of its day.
+
+    Args:
+        wallet_address (str): Only rebuild this recipient's buckets (all recipients if None)
+        since (datetime): Only rebuild days from this one on (from the start if None)
+        until (datetime): Only rebuild days before this moment (up to now if None)
+
+    Returns:
+        int: Number of buckets in the rebuilt range
+    """
+    db = get_db()
+    started = datetime.now(UTC)
+
+    days = {}
+    if since:
+        days['$gte'] = _day_start(since)
+    if until:
+        # Round up to the next midnight unless until already is one
+        days['$lt'] = _day_start(until - timedelta(microseconds=1)) + timedelta(days=1)
+
+    match = {'status': 'completed'}
+    if wallet_address:
+        match['recipient.walletAddress'] = wallet_address
+    if days:
+        match['createdAt'] = days
+
+    pipeline = [
+        {'$match': match},
+        {'$unionWith': {'coll': ARCHIVE_COLLECTION, 'pipeline': [{'$match': archive_query(match)}]}},
+        {'$group': {
+            '_id': {
+                'recipient': '$recipient.walletAddress',
+                'day': {'$dateFromParts': {
+                    'year': {'$year': '$createdAt'},
+                    'month': {'$month': '$createdAt'},
+                    'day': {'$dayOfMonth': '$createdAt'}
+                }}
+            },
+            'count': {'$sum': 1},
+            'totalSol': {'$sum': '$amount'},
+            'senders': {'$addToSet': '$sender.walletAddress'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'recipient': '$_id.recipient',
+            'day': '$_id.day',
+            'count': 1,
+            'totalSol': 1,
+            'senders': 1,
+            'uniqueSenders': {'$size': '$senders'},
+            'updatedAt': started
+        }},
+        {'$merge': {
+            'into': 'regard_daily',
+            'on': ['recipient', 'day'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ]
+
+    db.regards.aggregate(pipeline, allowDiskUse=True)
+
+    # Buckets not rewritten by this run no longer have any regards behind them
+    query = {'recipient': wallet_address} if wallet_address else {}
+    if days:
+        query['day'] = days
+    db.regard_daily.delete_many({**query, 'updatedAt': {'$lt': started}})
+
+    return db.regard_daily.count_documents(query)
+
+def get_regard_timeseries(wallet_address, start, end, interval='day'):
+    """
+    Get a time series of received regards from the daily buckets
+
+    Args:
+        wallet_address (str): Recipient wallet address
+        start (datetime): First day of the range (inclusive)
+        end (datetime): Last day of the range (inclusive)
+        interval (str): "day" or "week" (weeks start on Monday)
+
+    Returns:
+        list: Points with date, count, totalSol and uniqueSenders, oldest first.
+              Days without regards are included with zero values.
+    """
+    db = get_db(ROLE_ANALYTICS)
+    rollup_collection = db.regard_daily
+
+    start = _day_start(start)
+    end = _day_start(end)
+
+    # Daily points can use the stored cardinality; weekly points need the sets to union
+    projection = {'_id': 0, 'day': 1, 'count': 1, 'totalSol': 1}
+    projection['senders' if interval == 'week' else 'uniqueSenders'] = 1
+
+    cursor = rollup_collection.find(
+        {'recipient': wallet_address, 'day': {'$gte': start, '$lte': end}},
+        projection,
+        session=current_session()
+    ).sort('day', pymongo.ASCENDING)
+    buckets = {_day_start(doc['day']): doc for doc in cursor}
+
+    if interval != 'week':
+        points = []
+        day = start
+        while day <= end:
+            bucket = buckets.get(day, {})
+            points.append({
+                'date': day.date().isoformat(),
+                'count': bucket.get('count', 0),
+                'totalSol': bucket.get('totalSol', 0),
+                'uniqueSenders': bucket.get('uniqueSenders', 0)
+            })
+            day += timedelta(days=1)
+        return points
+
+    step = timedelta(days=7)
+    start -= timedelta(days=start.weekday())
+
+    points = []
+    period_start = start
+    while period_start <= end:
+        period_end = min(period_start + step, end + timedelta(days=1))
+        count = 0
+        total_sol = 0
+        senders = set()
+        day = period_start
+        while day < period_end:
+            bucket = buckets.get(day)
+            if bucket:
+                count += bucket.get('count', 0)
+                total_sol += bucket.get('totalSol', 0)
+                senders.update(bucket.get('senders', []))
+            day += timedelta(days=1)
+        points.append({
+            'date': period_start.date().isoformat(),
+            'count': count,
+            'totalSol': total_sol,
+            'uniqueSenders': len(senders)
+        })
+        period_start += step
+
+    return points
@@ -0,0 +1,130 @@
+from datetime import datetime, UTC
+from api.db import get_db, current_session, ROLE_ANALYTICS
+from api.models.archive import ARCHIVE_COLLECTION, archive_query
+from pymongo.errors import DuplicateKeyError
+
+# Sender stats schema (collection: sender_stats):
+# {
+#   _id: string,              // sender wallet address
+#   totalSol: number,
+#   totalRegards: number,
+#   uniqueRecipients: number,
+#   updatedAt: datetime
+# }
+#
+# Sender/recipient pairs (collection: sender_recipients), used to count
+# unique recipients incrementally:
+# {
+#   _id: ObjectId,
+#   sender: string,
+#   recipient: string,
+#   firstAt: datetime
+# }
+
+def record_regard_in_sender_stats(regard):
+    """
+    Add a completed regard to its sender's running totals
+
+    Args:
+        regard (dict): Regard document with sender, recipient and amount
+    """
+    sender_wallet = regard.get('sender', {}).get('walletAddress')
+    recipient_wallet = regard.get('recipient', {}).get('walletAddress')
+    if not sender_wallet:
+        return
+
+    db = get_db()
+
+    try:
+        result = db.sender_recipients.update_one(
+            {'sender': sender_wallet, 'recipient': recipient_wallet},
+            {'$setOnInsert': {'firstAt': regard.get('createdAt') or datetime.now(UTC)}},
+            upsert=True,
+            session=current_session()
+        )
+        new_recipient = result.upserted_id is not None
+    except DuplicateKeyError:
+        # A concurrent upsert created the pair first
+        new_recipient = False
+
+    db.sender_stats.update_one(
+        {'_id': sender_wallet},
+        {
+            '$inc': {
+                'totalSol': regard.get('amount', 0),
+                'totalRegards': 1,
+                'uniqueRecipients': 1 if new_recipient else 0
+            },
+            '$set': {'updatedAt': datetime.now(UTC)}
+        },
+        upsert=True,
+        session=current_session()
+    )
+
+def get_sender_stats(wallet_address):
+    """
+    Get statistics for regards sent by a user
+
+    Args:
+        wallet_address (str): Sender wallet address
+
+    Returns:
+        dict: Statistics including totalSol, totalRegards, uniqueRecipients
+    """
+    db = get_db(ROLE_ANALYTICS)
+    stats = db.sender_stats.find_one(
+        {'_id': wallet_address},
+        {'_id': 0, 'totalSol': 1, 'totalRegards': 1, 'uniqueRecipients': 1},
+        session=current_session()
+    )
+    return stats or {
+        'totalSol': 0,
+        'totalRegards': 0,
+        'uniqueRecipients': 0
+    }
+
+def rebuild_sender_stats(wallet_address=None):
+    """
+    Recompute sender totals and pairs from the regards collection and its archive
+
+    Args:
+        wallet_address (str): Only rebuild this sender (all senders if None)
+    """
+    db = get_db()
+    match = {'status': 'completed', 'sender.walletAddress': {'$ne': None}}
+    if wallet_address:
+        match['sender.walletAddress'] = wallet_address
+
+    db.regards.aggregate([
+        {'$match': match},
+        {'$unionWith': {'coll': ARCHIVE_COLLECTION, 'pipeline': [{'$match': archive_query(match)}]}},
+        {'$group': {
+            '_id': {'sender': '$sender.walletAddress', 'recipient': '$recipient.walletAddress'},
+            'firstAt': {'$min': '$createdAt'}
+        }},
+        {'$project': {'_id': 0, 'sender': '$_id.sender', 'recipient': '$_id.recipient', 'firstAt': 1}},
+        {'$merge': {
+            'into': 'sender_recipients',
+            'on': ['sender', 'recipient'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ], allowDiskUse=True)
+
+    db.regards.aggregate([
+        {'$match': match},
+        {'$unionWith': {'coll': ARCHIVE_COLLECTION, 'pipeline': [{'$match': archive_query(match)}]}},
+        {'$group': {
+            '_id': '$sender.walletAddress',
+            'totalSol': {'$sum': '$amount'},
+            'totalRegards': {'$sum': 1},
+            'recipients': {'$addToSet': '$recipient.walletAddress'}
+        }},
+        {'$project': {
+            'totalSol': 1,
+            'totalRegards': 1,
+            'uniqueRecipients': {'$size': '$recipients'},
+            'updatedAt': '$$NOW'
+        }},
+        {'$merge': {'into': 'sender_stats', 'on': '_id', 'whenMatched': 'replace', 'whenNotMatched': 'insert'}}
+    ], allowDiskUse=True)
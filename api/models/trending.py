@@ -0,0 +1,214 @@
+from datetime import datetime, timedelta, UTC
+from api.db import get_db, current_session, ROLE_ANALYTICS
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Trending bucket schema (collection: trending_hourly):
+# {
+#   _id: ObjectId,
+#   hour: datetime,           // start of the UTC hour
+#   recipient: string,        // recipient wallet address
+#   username: string,         // recipient username at the time of the last regard
+#   count: number,            // completed regards received in that hour
+#   totalSol: number,
+#   updatedAt: datetime       // last incremental write or rebuild
+# }
+# Buckets expire through a TTL index once they fall out of the longest window.
+
+# Leaderboard windows in hours
+TRENDING_WINDOWS = {'24h': 24, '7d': 24 * 7, '30d': 24 * 30}
+# Buckets are kept one day longer than the longest window
+BUCKET_RETENTION = timedelta(hours=max(TRENDING_WINDOWS.values()) + 24)
+# Recipients kept in memory per window
+TRENDING_TOP_K = int(os.environ.get('TRENDING_TOP_K', 100))
+# Seconds between leaderboard refreshes
+TRENDING_REFRESH_SECONDS = int(os.environ.get('TRENDING_REFRESH_SECONDS', 60))
+
+def _hour_start(moment):
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return moment.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+
+def record_regard_in_trending(regard):
+    """
+    Add a completed regard to its recipient's hourly trending bucket
+
+    Args:
+        regard (dict): Regard document with recipient, amount and createdAt
+    """
+    db = get_db()
+    db.trending_hourly.update_one(
+        {
+            'hour': _hour_start(regard.get('createdAt') or datetime.now(UTC)),
+            'recipient': regard['recipient']['walletAddress']
+        },
+        {
+            '$inc': {'count': 1, 'totalSol': regard.get('amount', 0)},
+            '$set': {'username': regard['recipient'].get('username'), 'updatedAt': datetime.now(UTC)}
+        },
+        upsert=True,
+        session=current_session()
+    )
+
+def compute_top_recipients(window_hours, limit=TRENDING_TOP_K, now=None):
+    """
+    Aggregate the hourly buckets of a sliding window into a ranking
+
+    Reads only buckets inside the window, so the cost depends on recent
+    activity rather than on the size of the regards collection.
+
+    Returns:
+        list: {username, count} entries, most regards first
+    """
+    db = get_db(ROLE_ANALYTICS)
+    since = _hour_start(now or datetime.now(UTC)) - timedelta(hours=window_hours - 1)
+
+    pipeline = [
+        {'$match': {'hour': {'$gte': since}}},
+        {'$sort': {'hour': 1}},
+        {'$group': {
+            '_id': '$recipient',
+            'count': {'$sum': '$count'},
+            'username': {'$last': '$username'}
+        }},
+        {'$sort': {'count': -1, '_id': 1}},
+        {'$limit': limit},
+        {'$project': {'_id': 0, 'username': 1, 'count': 1}}
+    ]
+    return list(db.trending_hourly.aggregate(pipeline, allowDiskUse=True))
+
+def rebuild_trending_buckets(now=None):
+    """
+    Recompute the hourly buckets of the retention period from the regards collection
+
+    Uses the createdAt index to read only regards inside the retention period.
+
+    Returns:
+        int: Number of buckets written
+    """
+    db = get_db()
+    started = datetime.now(UTC)
+    since = _hour_start(now or started) - BUCKET_RETENTION
+
+    db.regards.aggregate([
+        {'$match': {'createdAt': {'$gte': since}, 'status': 'completed'}},
+        {'$sort': {'createdAt': 1}},
+        {'$group': {
+            '_id': {
+                'recipient': '$recipient.walletAddress',
+                'hour': {'$dateFromParts': {
+                    'year': {'$year': '$createdAt'},
+                    'month': {'$month': '$createdAt'},
+                    'day': {'$dayOfMonth': '$createdAt'},
+                    'hour': {'$hour': '$createdAt'}
+                }}
+            },
+            'count': {'$sum': 1},
+            'totalSol': {'$sum': '$amount'},
+            'username': {'$last': '$recipient.username'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'recipient': '$_id.recipient',
+            'hour': '$_id.hour',
+            'count': 1,
+            'totalSol': 1,
+            'username': 1,
+            'updatedAt': started
+        }},
+        {'$merge': {
+            'into': 'trending_hourly',
+            'on': ['hour', 'recipient'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ], allowDiskUse=True)
+
+    # Buckets in the period that neither the rebuild nor a regard recorded
+    # since it started have written have no regards behind them ($nor also
+    # matches buckets without updatedAt)
+    db.trending_hourly.delete_many({'hour': {'$gte': since}, '$nor': [{'updatedAt': {'$gte': started}}]})
+    return db.trending_hourly.count_documents({'hour': {'$gte': since}})
+
+class TrendingLeaderboard:
+    """
+    Top recipients per window, kept in memory and refreshed on a schedule
+
+    Readers always get the last computed ranking; a daemon thread recomputes
+    all windows every TRENDING_REFRESH_SECONDS. Until a first ranking exists,
+    each read tries to compute it.
+    """
+
+    def __init__(self, refresh_seconds=TRENDING_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._rankings = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    def refresh(self):
+        rankings = {
+            name: compute_top_recipients(hours)
+            for name, hours in TRENDING_WINDOWS.items()
+        }
+        self._rankings = rankings
+        self._refreshed_at = datetime.now(UTC)
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Error refreshing trending leaderboard: %s", str(e))
+
+    def _ensure_started(self):
+        # Started lazily so each forked worker runs its own refresher
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='trending-refresh', daemon=True)
+                self._thread.start()
+                self._thread_pid = os.getpid()
+
+    def _ensure_ranking(self):
+        # A failed first refresh is retried by the next read (one at a time)
+        # rather than leaving readers with an empty ranking until the thread runs
+        if self._refreshed_at is not None:
+            return
+        with self._refresh_lock:
+            if self._refreshed_at is None:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error("Error computing trending leaderboard: %s", str(e))
+
+    def get(self, window, limit):
+        """
+        Get the top recipients of a window
+
+        Returns:
+            tuple: (ranking list, datetime of the last refresh); the datetime
+                   is None if no ranking could be computed yet
+        """
+        self._ensure_started()
+        self._ensure_ranking()
+        return self._rankings.get(window, [])[:limit], self._refreshed_at
+
+_leaderboard = TrendingLeaderboard()
+
+def get_trending_recipients(window, limit=10):
+    """
+    Get the top recipients of a window ("24h", "7d" or "30d") from memory
+
+    Returns:
+        tuple: (ranking list, datetime of the last refresh or None if unavailable)
+    """
+    return _leaderboard.get(window, limit)
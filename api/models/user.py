@@ -1,5 +1,5 @@
 from datetime import datetime, UTC
-from api.db import get_db
+from api.db import get_db, current_session, ROLE_PRIMARY
 import pymongo
 try:
     from bson import ObjectId
@@ -15,6 +15,7 @@ except ImportError:
 #   displayName: string,
 #   bio: string,
 #   profileImage: string,
+#   webhookCount: number,  // registered webhooks, so regards are only queued for delivery when needed
 #   createdAt: datetime,
 #   updatedAt: datetime
 # }
@@ -38,7 +39,7 @@ def create_user(user_data):
     user_data['updatedAt'] = now
     
     # Insert document
-    result = user_collection.insert_one(user_data)
+    result = user_collection.insert_one(user_data, session=current_session())
     user_data['_id'] = str(result.inserted_id)
     
     return user_data
@@ -64,7 +65,8 @@ def update_user(wallet_address, update_data):
     result = user_collection.find_one_and_update(
         {'walletAddress': wallet_address},
         {'$set': update_data},
-        return_document=pymongo.ReturnDocument.AFTER
+        return_document=pymongo.ReturnDocument.AFTER,
+        session=current_session()
     )
     
     if result:
@@ -84,32 +86,59 @@ def find_user_by_wallet(wallet_address):
     """
     db = get_db()
     user_collection = db.users
-    user = user_collection.find_one({'walletAddress': wallet_address})
+    user = user_collection.find_one({'walletAddress': wallet_address}, session=current_session())
     
     if user:
         user['_id'] = str(user['_id'])
     
     return user
 
-def find_user_by_username(username):
+def find_user_by_username(username, role=ROLE_PRIMARY):
     """
     Find a user by username
     
     Args:
         username (str): Username to search for
+        role (str): Database role; public routes pass ROLE_PUBLIC to read from secondaries
         
     Returns:
         dict: User document or None if not found
     """
-    db = get_db()
+    db = get_db(role)
     user_collection = db.users
-    user = user_collection.find_one({'username': username})
+    user = user_collection.find_one({'username': username}, session=current_session())
     
     if user:
         user['_id'] = str(user['_id'])
     
     return user
 
+def find_users_by_usernames(usernames, role=ROLE_PRIMARY):
+    """
+    Find several users by username with a single query
+    
+    Args:
+        usernames (list): Usernames to search for
+        role (str): Database role
+        
+    Returns:
+        dict: User documents keyed by username (missing users are absent)
+    """
+    db = get_db(role)
+    user_collection = db.users
+    cursor = user_collection.find(
+        {'username': {'$in': list(set(usernames))}},
+        {'username': 1, 'profileImage': 1, 'profileImageVariants': 1},
+        session=current_session()
+    )
+    
+    users = {}
+    for user in cursor:
+        user['_id'] = str(user['_id'])
+        users[user['username']] = user
+    
+    return users
+
 def username_exists(username):
     """
     Check if a username already exists in the database
@@ -122,4 +151,4 @@ def username_exists(username):
     """
     db = get_db()
     user_collection = db.users
-    return user_collection.count_documents({'username': username}) > 0 
\ No newline at end of file
+    return user_collection.count_documents({'username': username}, session=current_session()) > 0 
\ No newline at end of file
@@ -0,0 +1,123 @@
+from datetime import datetime, UTC
+from api.db import get_db, current_session
+import secrets
+try:
+    from bson import ObjectId
+except ImportError:
+    # Fallback for various pymongo package configurations
+    from pymongo.bson.objectid import ObjectId
+
+# Webhook schema (collection: webhooks), kept apart from users so profile
+# reads can never return a signing secret:
+# {
+#   _id: ObjectId,
+#   walletAddress: string,    // owner, notified for regards they receive
+#   type: string,             // "webhook" (signed JSON) or "discord"
+#   url: string,
+#   secret: string,           // HMAC key for the signature header
+#   createdAt: datetime
+# }
+
+WEBHOOK_TYPES = ('webhook', 'discord')
+MAX_WEBHOOKS_PER_USER = 5
+
+# Fields returned to the owner; the secret is only shown once, on creation
+WEBHOOK_PUBLIC_PROJECTION = {'walletAddress': 0, 'secret': 0}
+
+def create_webhook(wallet_address, url, webhook_type='webhook'):
+    """
+    Register a webhook for a user
+
+    The user's webhookCount is raised first, and only while it is below
+    MAX_WEBHOOKS_PER_USER, so concurrent requests can't exceed the cap.
+
+    Args:
+        wallet_address (str): Owner wallet address
+        url (str): Destination URL
+        webhook_type (str): One of WEBHOOK_TYPES
+
+    Returns:
+        dict: Created webhook, including its secret, or None if the user
+              already has MAX_WEBHOOKS_PER_USER webhooks
+    """
+    db = get_db()
+    reserved = db.users.update_one(
+        {
+            'walletAddress': wallet_address,
+            '$or': [
+                {'webhookCount': {'$lt': MAX_WEBHOOKS_PER_USER}},
+                {'webhookCount': {'$exists': False}}
+            ]
+        },
+        {'$inc': {'webhookCount': 1}},
+        session=current_session()
+    )
+    if reserved.modified_count == 0:
+        return None
+
+    webhook = {
+        'walletAddress': wallet_address,
+        'type': webhook_type,
+        'url': url,
+        'secret': secrets.token_hex(32),
+        'createdAt': datetime.now(UTC)
+    }
+    try:
+        result = db.webhooks.insert_one(webhook, session=current_session())
+    except Exception:
+        # Give the reserved slot back
+        db.users.update_one({'walletAddress': wallet_address}, {'$inc': {'webhookCount': -1}}, session=current_session())
+        raise
+    webhook['_id'] = str(result.inserted_id)
+    return webhook
+
+def list_webhooks(wallet_address):
+    """
+    List a user's webhooks without their secrets
+
+    Returns:
+        list: Webhook documents, oldest first
+    """
+    db = get_db()
+    cursor = db.webhooks.find(
+        {'walletAddress': wallet_address},
+        WEBHOOK_PUBLIC_PROJECTION,
+        session=current_session()
+    ).sort('_id', 1)
+
+    result = []
+    for doc in cursor:
+        doc['_id'] = str(doc['_id'])
+        result.append(doc)
+    return result
+
+def delete_webhook(wallet_address, webhook_id):
+    """
+    Delete one of a user's webhooks
+
+    Returns:
+        bool: True if the webhook existed and belonged to the user
+    """
+    db = get_db()
+    result = db.webhooks.delete_one(
+        {'_id': ObjectId(webhook_id), 'walletAddress': wallet_address},
+        session=current_session()
+    )
+    if result.deleted_count == 0:
+        return False
+    db.users.update_one({'walletAddress': wallet_address}, {'$inc': {'webhookCount': -1}}, session=current_session())
+    return True
+
+def get_webhooks_by_wallets(wallet_addresses):
+    """
+    Get the webhooks of several users with a single query, secrets included
+
+    Returns:
+        dict: Lists of webhook documents keyed by wallet address
+    """
+    db = get_db()
+    webhooks = {}
+    for doc in db.webhooks.find({'walletAddress': {'$in': list(set(wallet_addresses))}}, session=current_session()):
+        doc['_id'] = str(doc['_id'])
+        webhooks.setdefault(doc['walletAddress'], []).append(doc)
+    return webhooks
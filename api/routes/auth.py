@@ -4,12 +4,14 @@ import os
 from datetime import datetime, timedelta
 from api.utils.solana import verify_wallet_signature
 from api.models.user import find_user_by_wallet
+from api.middleware.rate_limit import rate_limit
 
 # Initialize blueprint
 auth_bp = Blueprint('auth', __name__)
 
 # Generate a nonce for the wallet to sign
 @auth_bp.route('/nonce', methods=['POST'])
+@rate_limit('auth-nonce', per_ip=(30, 60), per_wallet=(10, 60))
 def generate_nonce():
     """
     Generate a unique nonce for wallet signature verification
@@ -29,6 +31,7 @@ def generate_nonce():
 
 # Verify wallet signature and authenticate user
 @auth_bp.route('/verify-signature', methods=['POST'])
+@rate_limit('auth-verify', per_ip=(20, 60), per_wallet=(5, 60))
 def verify_signature():
     """
     Verify the wallet signature and authenticate the user
@@ -0,0 +1,131 @@
+from flask import Blueprint, request, jsonify
+import os
+from api.middleware.auth import token_required
+from api.middleware.deadline import bounded_timeout
+from api.middleware.rate_limit import rate_limit
+from api.models.regard import get_nft_regards_by_recipient
+from api.models.user import find_user_by_username
+from api.utils.nft import (
+    get_templates, get_template, get_assets_url, prepare_certificate, wait_for_certificate,
+    load_render_spec, render_queue_full, NFT_NAMESPACE
+)
+from api.utils.storage import is_valid_digest, media_path, send_immutable_file
+
+# Initialize blueprint
+nft_bp = Blueprint('nft', __name__)
+
+# Seconds an image request waits for a render still in progress
+RENDER_WAIT_SECONDS = float(os.environ.get('NFT_RENDER_WAIT_SECONDS', 5))
+
+# Get available certificate templates
+@nft_bp.route('/templates', methods=['GET'])
+def list_templates():
+    """
+    Get the available NFT certificate templates
+    """
+    response = jsonify(get_templates())
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+# Generate certificate metadata
+@nft_bp.route('/metadata', methods=['POST'])
+@rate_limit('nft-metadata', per_ip=(30, 60), per_wallet=(10, 60), wallet_from='token')
+@token_required
+def generate_metadata(current_user):
+    """
+    Generate metadata for an NFT certificate
+    Request body: {
+        templateId: string,
+        recipient: string (username),
+        message: string,
+        amount: number
+    }
+    """
+    data = request.json or {}
+    
+    required_fields = ['templateId', 'recipient', 'amount']
+    for field in required_fields:
+        if field not in data:
+            return jsonify({"error": f"{field} is required"}), 400
+    
+    template = get_template(data['templateId'])
+    if not template:
+        return jsonify({"error": "Unknown template"}), 400
+    
+    try:
+        amount = float(data['amount'])
+        if amount <= 0:
+            return jsonify({"error": "Amount must be greater than 0"}), 400
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid amount format"}), 400
+    
+    if not find_user_by_username(data['recipient']):
+        return jsonify({"error": "Recipient not found"}), 404
+    
+    # Each new certificate queues a render; refuse new ones while the queue is full
+    if render_queue_full():
+        return _rendering_busy_response("Certificate rendering is busy, try again shortly")
+    
+    certificate = prepare_certificate(
+        template,
+        data['recipient'],
+        current_user.get('username'),
+        amount,
+        data.get('message', ''),
+        get_assets_url()
+    )
+    
+    return jsonify(certificate)
+
+# Get the current user's NFT collection
+@nft_bp.route('/collection', methods=['GET'])
+@token_required
+def get_collection(current_user):
+    """
+    Get the NFT certificates received by the current user
+    Query parameters:
+    - limit: number (default 50)
+    - offset: number (default 0)
+    """
+    wallet_address = current_user.get('walletAddress')
+    limit = min(request.args.get('limit', 50, type=int), 100)
+    offset = request.args.get('offset', 0, type=int)
+    
+    return jsonify(get_nft_regards_by_recipient(wallet_address, limit, offset))
+
+# Serve certificate metadata
+@nft_bp.route('/assets/<digest>.json', methods=['GET'])
+def get_metadata_asset(digest):
+    """
+    Serve certificate metadata by content digest
+    """
+    path = media_path(NFT_NAMESPACE, f'{digest}.json') if is_valid_digest(digest) else None
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Metadata not found"}), 404
+    
+    return send_immutable_file(path, 'application/json')
+
+# Serve certificate images
+@nft_bp.route('/assets/<digest>.png', methods=['GET'])
+def get_image_asset(digest):
+    """
+    Serve a certificate image by content digest, rendering it if needed
+    """
+    if not is_valid_digest(digest):
+        return jsonify({"error": "Image not found"}), 404
+    
+    path = wait_for_certificate(digest, bounded_timeout(RENDER_WAIT_SECONDS))
+    if path:
+        return send_immutable_file(path, 'image/png')
+    
+    if load_render_spec(digest) is None:
+        return jsonify({"error": "Image not found"}), 404
+    
+    return _rendering_busy_response("Image is still rendering")
+
+# Helper function building the 503 answered while renders are pending
+def _rendering_busy_response(message):
+    response = jsonify({"error": message})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
@@ -1,15 +1,43 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import csv
+import io
+import json
+from datetime import datetime, timedelta, UTC
+from bson import ObjectId
 from api.middleware.auth import token_required
-from api.models.regard import create_regard, get_regards_by_recipient, get_regard_stats
+from api.middleware.rate_limit import rate_limit
+from api.middleware.deadline import with_deadline
+from api.models.regard import create_regard, get_regards_by_recipient, get_regards_by_sender, search_regards_by_recipient, get_regard_stats, iter_regards_by_recipient, get_regard_by_id
+from api.models.sender_stats import get_sender_stats
+from api.models.rollup import get_regard_timeseries
+from api.models.trending import get_trending_recipients, TRENDING_WINDOWS, TRENDING_TOP_K, TRENDING_REFRESH_SECONDS
 from api.models.user import find_user_by_username
+from api.db import ROLE_PUBLIC
 from api.utils.solana import verify_transaction
 from api.utils.profile import get_profile_image
+from api.utils.cursor import encode_cursor, decode_cursor
+from api.utils.nft import get_template, get_assets_url, prepare_certificate
 
 # Initialize blueprint
 regards_bp = Blueprint('regards', __name__)
 
+# Columns written by the CSV export, in order
+EXPORT_CSV_COLUMNS = [
+    'id', 'createdAt', 'senderWallet', 'senderUsername', 'recipientUsername',
+    'amount', 'message', 'transactionSignature', 'includesNft', 'nftMintAddress', 'cursor'
+]
+EXPORT_BATCH_SIZE = 500
+# Avatar size rendered next to each regard in list views (pixels)
+LIST_AVATAR_SIZE = 40
+# Longest date range a single time series request may cover
+TIMESERIES_MAX_DAYS = 731
+# Longest accepted search query (characters)
+SEARCH_MAX_LENGTH = 200
+
 # Send a regard (SOL + message)
 @regards_bp.route('/send', methods=['POST'])
+@with_deadline(20)
+@rate_limit('regards-send', per_ip=(30, 60), per_wallet=(10, 60), wallet_from='token')
 @token_required
 def send_regard(current_user):
     """
@@ -18,7 +46,10 @@ def send_regard(current_user):
         recipient: string (username),
         amount: number,
         message: string,
-        transactionSignature: string
+        transactionSignature: string,
+        includeNft: boolean (optional),
+        nftDesign: string (template ID, required with includeNft),
+        nftMintAddress: string (optional)
     }
     """
     data = request.json
@@ -39,6 +70,13 @@ def send_regard(current_user):
     except ValueError:
         return jsonify({"error": "Invalid amount format"}), 400
     
+    # Validate the certificate template before any RPC work
+    nft_template = None
+    if data.get('includeNft'):
+        nft_template = get_template(data.get('nftDesign'))
+        if not nft_template:
+            return jsonify({"error": "Unknown NFT design"}), 400
+    
     # Get recipient user
     recipient_user = find_user_by_username(data['recipient'])
     if not recipient_user:
@@ -70,11 +108,24 @@ def send_regard(current_user):
         'amount': amount,
         'message': data['message'],
         'transactionSignature': data['transactionSignature'],
-        'status': 'completed'
+        'status': 'completed',
+        'includesNft': nft_template is not None
     }
     
+    if nft_template:
+        certificate = prepare_certificate(
+            nft_template, data['recipient'], sender_username, amount, data['message'], get_assets_url()
+        )
+        regard_data['nft'] = {
+            'design': nft_template['id'],
+            'mintAddress': data.get('nftMintAddress'),
+            'image': certificate['image'],
+            'metadataUri': certificate['metadataUri'],
+            'name': certificate['metadata']['name']
+        }
+    
     # Save regard to database
-    regard = create_regard(regard_data)
+    regard = create_regard(regard_data, notify=bool(recipient_user.get('webhookCount')))
     
     return jsonify({
         "message": "Regard sent successfully",
@@ -103,14 +154,228 @@ def get_user_regards(current_user):
         # Add sender information if needed
         if 'sender' in regard and 'username' in regard['sender'] and 'profileImage' not in regard['sender']:
             # Get full user info for the sender
-            sender = find_user_by_username(regard['sender']['username'])
+            sender = find_user_by_username(regard['sender']['username'], ROLE_PUBLIC)
             if sender:
-                regard['sender']['profileImage'] = sender.get('profileImage') or get_profile_image(sender)
+                regard['sender']['profileImage'] = get_profile_image(sender, LIST_AVATAR_SIZE)
             else:
                 regard['sender']['profileImage'] = get_profile_image({'username': regard['sender']['username']})
     
     return jsonify(regards)
 
+# Search the current user's received regards
+@regards_bp.route('/search', methods=['GET'])
+@token_required
+def search_user_regards(current_user):
+    """
+    Search the messages of regards received by the current user, best matches first
+    Query parameters:
+    - q: search terms (quote "phrases", prefix -words to exclude)
+    - limit: number (default 10, max 50)
+    - cursor: nextCursor from the previous page
+    """
+    wallet_address = current_user.get('walletAddress')
+    text = (request.args.get('q') or '').strip()
+    if not text:
+        return jsonify({"error": "q is required"}), 400
+    if len(text) > SEARCH_MAX_LENGTH:
+        return jsonify({"error": f"q cannot exceed {SEARCH_MAX_LENGTH} characters"}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = _parse_search_cursor(cursor, text)
+        if not after:
+            return jsonify({"error": "Invalid cursor"}), 400
+    
+    regards = search_regards_by_recipient(wallet_address, text, limit, after)
+    next_cursor = _search_cursor(regards[-1], text) if len(regards) == limit else None
+    
+    return jsonify({
+        "regards": regards,
+        "nextCursor": next_cursor
+    })
+
+def _search_cursor(regard, text):
+    """
+    Encode the keyset position (score, _id) of a search result
+    """
+    # Scores only compare within one search, so the cursor is bound to its terms
+    return encode_cursor({'s': regard['score'], 'id': regard['_id'], 'q': text})
+
+def _parse_search_cursor(token, text):
+    """
+    Decode a search cursor into (score, _id), or None if it is invalid
+    """
+    try:
+        position = decode_cursor(token)
+        score = float(position['s'])
+    except (ValueError, KeyError, TypeError):
+        return None
+    if position.get('q') != text or not ObjectId.is_valid(position.get('id')):
+        return None
+    return score, position['id']
+
+# Get list of regards sent by the current user
+@regards_bp.route('/sent', methods=['GET'])
+@token_required
+def get_sent_regards(current_user):
+    """
+    Get regards sent by the current user, newest first
+    Query parameters:
+    - limit: number (default 10, max 100)
+    - cursor: nextCursor from the previous page
+    """
+    wallet_address = current_user.get('walletAddress')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        after = _parse_page_cursor(cursor)
+        if not after:
+            return jsonify({"error": "Invalid cursor"}), 400
+    
+    regards = get_regards_by_sender(wallet_address, limit, after)
+    next_cursor = _page_cursor(regards[-1]) if len(regards) == limit else None
+    
+    return jsonify({
+        "regards": regards,
+        "nextCursor": next_cursor
+    })
+
+# Get stats for regards sent by the current user
+@regards_bp.route('/sent/stats', methods=['GET'])
+@token_required
+def get_sent_stats(current_user):
+    """
+    Get statistics for the current user's sent regards
+    """
+    wallet_address = current_user.get('walletAddress')
+    
+    # Maintained incrementally as regards complete
+    stats = get_sender_stats(wallet_address)
+    
+    return jsonify(stats)
+
+def _page_cursor(regard):
+    """
+    Encode the keyset position (createdAt, _id) of a regard
+    """
+    created_at = regard['createdAt']
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=UTC)
+    return encode_cursor({'t': int(created_at.timestamp() * 1000), 'id': regard['_id']})
+
+def _parse_page_cursor(token):
+    """
+    Decode a keyset cursor into (createdAt, _id), or None if it is invalid
+    """
+    try:
+        position = decode_cursor(token)
+        created_at = datetime.fromtimestamp(int(position['t']) / 1000, UTC)
+    except (ValueError, KeyError, TypeError, OverflowError):
+        return None
+    if not ObjectId.is_valid(position.get('id')):
+        return None
+    return created_at, position['id']
+
+# Export the current user's full regards history
+@regards_bp.route('/export', methods=['GET'])
+@with_deadline(None)
+@token_required
+def export_user_regards(current_user):
+    """
+    Stream every regard received by the current user as NDJSON or CSV
+    Query parameters:
+    - format: "ndjson" (default) or "csv"
+    - cursor: resume token taken from the last row received
+
+    Every row carries a `cursor` token; pass it back to resume an
+    interrupted export right after that row.
+    """
+    wallet_address = current_user.get('walletAddress')
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "format must be 'ndjson' or 'csv'"}), 400
+
+    after_id = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after_id = decode_cursor(cursor).get('id')
+        except ValueError:
+            after_id = None
+        if not after_id or not ObjectId.is_valid(after_id):
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    regards = iter_regards_by_recipient(wallet_address, after_id, EXPORT_BATCH_SIZE)
+
+    if export_format == 'csv':
+        body = _stream_csv(regards)
+        mimetype = 'text/csv'
+    else:
+        body = _stream_ndjson(regards)
+        mimetype = 'application/x-ndjson'
+
+    filename = f"regards-{current_user.get('username') or wallet_address}.{export_format}"
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # Ask reverse proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _export_row(regard):
+    """
+    Flatten a regard document into an export row
+    """
+    sender = regard.get('sender') or {}
+    recipient = regard.get('recipient') or {}
+    nft = regard.get('nft') or {}
+    created_at = regard.get('createdAt')
+    return {
+        'id': regard['_id'],
+        'createdAt': created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+        'senderWallet': sender.get('walletAddress'),
+        'senderUsername': sender.get('username'),
+        'recipientUsername': recipient.get('username'),
+        'amount': regard.get('amount'),
+        'message': regard.get('message'),
+        'transactionSignature': regard.get('transactionSignature'),
+        'includesNft': bool(regard.get('includesNft')),
+        'nftMintAddress': nft.get('mintAddress'),
+        'cursor': encode_cursor({'id': regard['_id']})
+    }
+
+def _batched(regards, size=EXPORT_BATCH_SIZE):
+    """
+    Group rows into lists of at most `size` so each write flushes one batch
+    """
+    batch = []
+    for regard in regards:
+        batch.append(_export_row(regard))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _stream_ndjson(regards):
+    for batch in _batched(regards):
+        yield ''.join(json.dumps(row, default=str) + '\n' for row in batch)
+
+def _stream_csv(regards):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for batch in _batched(regards):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
 # Get user stats
 @regards_bp.route('/stats', methods=['GET'])
 @token_required
@@ -125,6 +390,111 @@ def get_user_stats(current_user):
     
     return jsonify(stats)
 
+# Get a time series of the current user's received regards
+@regards_bp.route('/timeseries', methods=['GET'])
+@token_required
+def get_user_timeseries(current_user):
+    """
+    Get SOL received per day or week from the daily rollups
+    Query parameters:
+    - from: YYYY-MM-DD (default 30 days ago)
+    - to: YYYY-MM-DD (default today)
+    - interval: "day" (default) or "week"
+    """
+    wallet_address = current_user.get('walletAddress')
+    interval = request.args.get('interval', 'day')
+    if interval not in ('day', 'week'):
+        return jsonify({"error": "interval must be 'day' or 'week'"}), 400
+    
+    try:
+        today = datetime.now(UTC)
+        end = _parse_date(request.args.get('to')) or today
+        start = _parse_date(request.args.get('from')) or end - timedelta(days=29)
+    except ValueError:
+        return jsonify({"error": "Dates must use the YYYY-MM-DD format"}), 400
+    
+    if start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+    if (end - start).days >= TIMESERIES_MAX_DAYS:
+        return jsonify({"error": f"Date range cannot exceed {TIMESERIES_MAX_DAYS} days"}), 400
+    
+    points = get_regard_timeseries(wallet_address, start, end, interval)
+    
+    return jsonify({
+        "interval": interval,
+        "from": start.date().isoformat(),
+        "to": end.date().isoformat(),
+        "points": points
+    })
+
+def _parse_date(value):
+    """
+    Parse a YYYY-MM-DD query parameter into a UTC datetime (None if absent)
+    """
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=UTC)
+
+# Get the platform-wide trending recipients
+@regards_bp.route('/trending', methods=['GET'])
+def get_trending():
+    """
+    Get the recipients with the most regards in a sliding window
+    Query parameters:
+    - window: "24h" (default), "7d" or "30d"
+    - limit: number of recipients (default 10)
+    
+    Served from an in-memory ranking refreshed every TRENDING_REFRESH_SECONDS.
+    """
+    window = request.args.get('window', '24h')
+    if window not in TRENDING_WINDOWS:
+        return jsonify({"error": "window must be one of: " + ", ".join(TRENDING_WINDOWS)}), 400
+    
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    if limit < 1 or limit > TRENDING_TOP_K:
+        return jsonify({"error": f"limit must be between 1 and {TRENDING_TOP_K}"}), 400
+    
+    recipients, refreshed_at = get_trending_recipients(window, limit)
+    if refreshed_at is None:
+        # No ranking computed yet; the next request tries again
+        return jsonify({"error": "Trending is temporarily unavailable"}), 503
+    
+    response = jsonify({
+        "window": window,
+        "updatedAt": refreshed_at.isoformat(),
+        "recipients": [
+            {"rank": rank, "username": entry.get('username'), "count": entry['count']}
+            for rank, entry in enumerate(recipients, start=1)
+        ]
+    })
+    response.headers['Cache-Control'] = f'public, max-age={TRENDING_REFRESH_SECONDS}'
+    return response
+
+# Get a single regard
+@regards_bp.route('/<regard_id>', methods=['GET'])
+@token_required
+def get_regard(current_user, regard_id):
+    """
+    Get the full document of a regard sent or received by the current user
+    """
+    if not ObjectId.is_valid(regard_id):
+        return jsonify({"error": "Invalid regard ID"}), 400
+    
+    regard = get_regard_by_id(regard_id)
+    
+    # Regards of other users are reported as missing so IDs can't be probed
+    wallet_address = current_user.get('walletAddress')
+    if not regard or wallet_address not in (
+        regard.get('sender', {}).get('walletAddress'),
+        regard.get('recipient', {}).get('walletAddress')
+    ):
+        return jsonify({"error": "Regard not found"}), 404
+    
+    return jsonify(regard)
+
 # Get public stats for a user by username
 @regards_bp.route('/public-stats/<username>', methods=['GET'])
 def get_public_stats(username):
@@ -132,7 +502,7 @@ def get_public_stats(username):
     Get public statistics for a user by username
     """
     # Look up user by username and get their wallet address
-    user = find_user_by_username(username)
+    user = find_user_by_username(username, ROLE_PUBLIC)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
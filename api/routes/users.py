@@ -1,11 +1,37 @@
 from flask import Blueprint, request, jsonify
+import os
+import re
+import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from api.middleware.auth import token_required
-from api.models.user import create_user, update_user, find_user_by_username, find_user_by_wallet, username_exists
-from api.utils.profile import get_profile_image
+from api.middleware.deadline import with_deadline, remaining_time, DeadlineExceeded
+from api.models.user import create_user, update_user, find_user_by_username, find_user_by_wallet, find_users_by_usernames, username_exists
+from api.models.regard import get_regards_by_recipient, get_regard_stats
+from api.models.webhook import create_webhook, list_webhooks, delete_webhook, WEBHOOK_TYPES, MAX_WEBHOOKS_PER_USER
+from api.utils.profile import (
+    get_profile_image, ingest_profile_image, avatar_variant_urls,
+    AVATAR_NAMESPACE, AVATAR_DEFAULT_SIZE, AVATAR_MAX_BYTES
+)
+from api.utils.storage import media_path, public_api_url, send_immutable_file
+from api.utils.workers import submit_in_context
+from api.utils.webhooks import validate_webhook_url
+from api.db import ROLE_PUBLIC
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
 
 # Initialize blueprint
 users_bp = Blueprint('users', __name__)
 
+# Sections of the composite public profile
+PUBLIC_PROFILE_FIELDS = ('profile', 'stats', 'recent')
+# Avatar size rendered next to recent regards on the public profile (pixels)
+RECENT_AVATAR_SIZE = 40
+
+# <sha256>-<size>.<ext>, as written by ingest_profile_image
+AVATAR_FILENAME_PATTERN = re.compile(r'^[0-9a-f]{64}-\d+\.(webp|png)$')
+
 # Check if username is available
 @users_bp.route('/check-username', methods=['GET'])
 def check_username():
@@ -121,18 +147,78 @@ def update_profile(current_user):
         update_data['bio'] = data['bio']
     if 'profileImage' in data:
         update_data['profileImage'] = data['profileImage']
+        # A client-supplied URL replaces any uploaded variants
+        update_data['profileImageVariants'] = None
     
     updated_user = update_user(wallet_address, update_data)
     
     return jsonify(updated_user)
 
+# Upload a profile image
+@users_bp.route('/profile/image', methods=['POST'])
+@with_deadline(40)
+@token_required
+def upload_profile_image(current_user):
+    """
+    Upload a profile image and store resized variants
+    Multipart form field: image (PNG, JPEG, WebP or GIF)
+    """
+    wallet_address = current_user.get('walletAddress')
+    
+    user = find_user_by_wallet(wallet_address)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    
+    if request.content_length and request.content_length > AVATAR_MAX_BYTES + 64 * 1024:
+        return jsonify({"error": "Image is too large"}), 413
+    
+    upload = request.files.get('image')
+    if not upload:
+        return jsonify({"error": "image file is required"}), 400
+    
+    data = upload.read(AVATAR_MAX_BYTES + 1)
+    if len(data) > AVATAR_MAX_BYTES:
+        return jsonify({"error": "Image is too large"}), 413
+    
+    try:
+        digest, error = ingest_profile_image(data, timeout=remaining_time())
+    except FutureTimeoutError:
+        return jsonify({"error": "Image processing timed out"}), 503
+    except (BrokenProcessPool, OSError) as e:
+        # The render pool or media storage failed; the upload itself may be fine
+        logger.error("Profile image processing failed for %s: %s", wallet_address, str(e))
+        return jsonify({"error": "Image processing is temporarily unavailable"}), 503
+    if error:
+        return jsonify({"error": error}), 400
+    
+    variants = avatar_variant_urls(digest, public_api_url('/users/avatars'))
+    updated_user = update_user(wallet_address, {
+        'profileImage': variants[str(AVATAR_DEFAULT_SIZE)]['webp'],
+        'profileImageVariants': variants
+    })
+    
+    return jsonify(updated_user)
+
+# Serve profile image variants
+@users_bp.route('/avatars/<filename>', methods=['GET'])
+def get_avatar(filename):
+    """
+    Serve a content-addressed profile image variant
+    """
+    match = AVATAR_FILENAME_PATTERN.match(filename)
+    path = media_path(AVATAR_NAMESPACE, filename) if match else None
+    if not path or not os.path.exists(path):
+        return jsonify({"error": "Image not found"}), 404
+    
+    return send_immutable_file(path, f"image/{match.group(1)}")
+
 # Get user by username (public profile)
 @users_bp.route('/username/<username>', methods=['GET'])
 def get_user_by_username(username):
     """
     Get a user's public profile by username
     """
-    user = find_user_by_username(username)
+    user = find_user_by_username(username, ROLE_PUBLIC)
     if not user:
         return jsonify({"error": "User not found"}), 404
     
@@ -146,6 +232,136 @@ def get_user_by_username(username):
     
     return jsonify(public_user)
 
+# Get a public profile page in one request
+@users_bp.route('/public/<username>', methods=['GET'])
+def get_public_profile(username):
+    """
+    Get a user's public profile, public stats and recent regards together
+    Query parameters:
+    - fields: comma-separated subset of profile,stats,recent (default all)
+    - recentLimit: number of recent regards (default 5, max 20)
+    
+    The username is resolved once; stats and recent regards are then fetched
+    concurrently.
+    """
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',')] if fields else list(PUBLIC_PROFILE_FIELDS)
+    unknown = [field for field in fields if field not in PUBLIC_PROFILE_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    recent_limit = max(1, min(request.args.get('recentLimit', 5, type=int), 20))
+    
+    user = find_user_by_username(username, ROLE_PUBLIC)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    
+    wallet_address = user.get('walletAddress')
+    
+    # Start the independent sub-fetches before doing any other work
+    futures = {}
+    if 'stats' in fields:
+        futures['stats'] = submit_in_context(get_regard_stats, wallet_address)
+    if 'recent' in fields:
+        futures['recent'] = submit_in_context(get_regards_by_recipient, wallet_address, recent_limit, 0)
+    
+    response = {}
+    if 'profile' in fields:
+        response['profile'] = {
+            'username': user['username'],
+            'displayName': user['displayName'],
+            'bio': user['bio'],
+            'profileImage': user.get('profileImage') or get_profile_image(user)
+        }
+    
+    if 'stats' in futures:
+        stats = _result_within_deadline(futures['stats'], 'stats')
+        # Remove totalSol for privacy in public stats
+        stats.pop('totalSol', None)
+        response['stats'] = stats
+    
+    if 'recent' in futures:
+        recent = _result_within_deadline(futures['recent'], 'recent regards')
+        senders = find_users_by_usernames(
+            [regard['sender']['username'] for regard in recent if regard.get('sender', {}).get('username')],
+            ROLE_PUBLIC
+        )
+        for regard in recent:
+            # Amounts stay private on public pages, like totalSol in the stats
+            regard.pop('amount', None)
+            sender = regard.get('sender', {})
+            # Sender wallets stay private on public pages
+            sender.pop('walletAddress', None)
+            if sender.get('username'):
+                sender_user = senders.get(sender['username']) or {'username': sender['username']}
+                sender['profileImage'] = get_profile_image(sender_user, RECENT_AVATAR_SIZE)
+        response['recent'] = recent
+    
+    return jsonify(response)
+
+# List the current user's webhooks
+@users_bp.route('/webhooks', methods=['GET'])
+@token_required
+def get_webhooks(current_user):
+    """
+    List the webhooks notified when the current user receives a regard
+    """
+    # Webhooks belong to a profile; wallets without one can't own any
+    if 'walletAddress' not in current_user:
+        return jsonify({"error": "User not found"}), 404
+    
+    return jsonify(list_webhooks(current_user['walletAddress']))
+
+# Register a webhook
+@users_bp.route('/webhooks', methods=['POST'])
+@token_required
+def add_webhook(current_user):
+    """
+    Register a webhook notified when the current user receives a regard
+    Request body: {
+        url: string,
+        type: "webhook" (signed JSON, default) or "discord"
+    }
+    The response includes the signing secret; it is not shown again.
+    """
+    if 'walletAddress' not in current_user:
+        return jsonify({"error": "User not found"}), 404
+    
+    data = request.json or {}
+    wallet_address = current_user['walletAddress']
+    
+    webhook_type = data.get('type', 'webhook')
+    if webhook_type not in WEBHOOK_TYPES:
+        return jsonify({"error": "type must be one of: " + ", ".join(WEBHOOK_TYPES)}), 400
+    
+    error = validate_webhook_url(data.get('url'), webhook_type)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    webhook = create_webhook(wallet_address, data['url'], webhook_type)
+    if webhook is None:
+        return jsonify({"error": f"A user can register at most {MAX_WEBHOOKS_PER_USER} webhooks"}), 400
+    webhook.pop('walletAddress', None)
+    
+    return jsonify(webhook), 201
+
+# Delete a webhook
+@users_bp.route('/webhooks/<webhook_id>', methods=['DELETE'])
+@token_required
+def remove_webhook(current_user, webhook_id):
+    """
+    Delete one of the current user's webhooks
+    """
+    if not ObjectId.is_valid(webhook_id):
+        return jsonify({"error": "Invalid webhook ID"}), 400
+    
+    if 'walletAddress' not in current_user:
+        return jsonify({"error": "User not found"}), 404
+    
+    if not delete_webhook(current_user['walletAddress'], webhook_id):
+        return jsonify({"error": "Webhook not found"}), 404
+    
+    return jsonify({"message": "Webhook deleted"})
+
 # Helper function to validate username format
 def is_valid_username(username):
     """
@@ -156,4 +372,17 @@ def is_valid_username(username):
     """
     import re
     pattern = r'^[a-zA-Z0-9_-]{3,20}$'
-    return bool(re.match(pattern, username)) 
\ No newline at end of file
+    return bool(re.match(pattern, username)) 
+
+# Helper function waiting for fan-out results
+def _result_within_deadline(future, what):
+    """
+    Wait for a fan-out result no longer than the request's remaining budget
+    
+    Raises:
+        DeadlineExceeded: If the budget runs out first (answered with a 503)
+    """
+    try:
+        return future.result(timeout=remaining_time())
+    except FutureTimeoutError:
+        raise DeadlineExceeded(f"Request deadline exceeded waiting for {what}")
@@ -0,0 +1,41 @@
+import base64
+import json
+
+
+def encode_cursor(position):
+    """
+    Encode a pagination position as an opaque, URL-safe cursor token
+
+    Args:
+        position (dict): JSON-serializable position (e.g. {'id': '<ObjectId hex>'})
+
+    Returns:
+        str: Cursor token
+    """
+    raw = json.dumps(position, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor token produced by encode_cursor
+
+    Args:
+        token (str): Cursor token
+
+    Returns:
+        dict: Decoded position
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor: expected an object")
+
+    return position
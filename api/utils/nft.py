@@ -0,0 +1,328 @@
+import json
+import logging
+import os
+import textwrap
+import threading
+from io import BytesIO
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from api.utils.storage import content_digest, media_path, public_api_url, write_atomic
+from api.utils.workers import get_process_pool, discard_process_pool
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'nft_templates.json')
+
+# Media namespace of certificate metadata and images
+NFT_NAMESPACE = 'nft'
+CERTIFICATE_SIZE = (1200, 800)
+CERTIFICATE_SYMBOL = 'REGARD'
+# Longest message printed on a certificate
+MAX_CERTIFICATE_MESSAGE = 280
+
+# Renders queued or running in the process pool, at most NFT_MAX_PENDING_RENDERS
+MAX_PENDING_RENDERS = int(os.environ.get('NFT_MAX_PENDING_RENDERS', 32))
+
+# Renders currently running in the process pool, by image digest
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+class RenderQueueFull(Exception):
+    """Raised when MAX_PENDING_RENDERS renders are already pending"""
+
+@lru_cache(maxsize=1)
+def _load_templates():
+    with open(TEMPLATES_FILE, encoding='utf-8') as f:
+        templates = json.load(f)
+    return {template['id']: template for template in templates}
+
+def get_templates():
+    """
+    Get the certificate templates (loaded from disk once per process)
+
+    Returns:
+        list: Template definitions
+    """
+    return list(_load_templates().values())
+
+def get_template(template_id):
+    """
+    Get a certificate template by ID
+
+    Returns:
+        dict: Template definition or None if unknown
+    """
+    return _load_templates().get(template_id)
+
+def get_assets_url():
+    """
+    Public base URL of certificate assets
+    """
+    return public_api_url('/nft/assets')
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def build_render_spec(template_id, recipient, sender, amount, message):
+    """
+    Build the inputs of a certificate image
+
+    Identical inputs produce the same spec, and therefore the same image digest.
+
+    Returns:
+        tuple: (spec dict, image digest)
+    """
+    spec = {
+        'template': template_id,
+        'recipient': recipient,
+        'sender': sender or '',
+        'amount': round(float(amount), 9),
+        'message': (message or '')[:MAX_CERTIFICATE_MESSAGE]
+    }
+    return spec, content_digest(_canonical_json(spec))
+
+def build_certificate_metadata(template, spec, image_url):
+    """
+    Build Metaplex-compatible metadata for a certificate
+
+    Args:
+        template (dict): Certificate template
+        spec (dict): Render spec from build_render_spec
+        image_url (str): Immutable URL of the certificate image
+
+    Returns:
+        dict: Metadata JSON
+    """
+    attributes = [
+        {'trait_type': 'Template', 'value': template['name']},
+        {'trait_type': 'Recipient', 'value': spec['recipient']},
+        {'trait_type': 'Amount (SOL)', 'value': spec['amount']}
+    ]
+    if spec['sender']:
+        attributes.append({'trait_type': 'Sender', 'value': spec['sender']})
+
+    return {
+        'name': f"{template['name']} for @{spec['recipient']}",
+        'symbol': CERTIFICATE_SYMBOL,
+        'description': spec['message'] or template['description'],
+        'image': image_url,
+        'attributes': attributes,
+        'properties': {
+            'category': 'image',
+            'files': [{'uri': image_url, 'type': 'image/png'}]
+        }
+    }
+
+def store_certificate_metadata(metadata):
+    """
+    Store metadata under its content digest (written once per distinct certificate)
+
+    Returns:
+        str: Metadata digest
+    """
+    data = _canonical_json(metadata)
+    digest = content_digest(data)
+    path = media_path(NFT_NAMESPACE, f'{digest}.json')
+    if not os.path.exists(path):
+        write_atomic(path, data)
+    return digest
+
+def certificate_image_path(image_digest):
+    return media_path(NFT_NAMESPACE, f'{image_digest}.png')
+
+def store_render_spec(spec, image_digest):
+    """
+    Keep the render inputs next to the image so it can be rendered on demand
+    """
+    path = media_path(NFT_NAMESPACE, f'{image_digest}.spec.json')
+    if not os.path.exists(path):
+        write_atomic(path, _canonical_json(spec))
+
+def load_render_spec(image_digest):
+    path = media_path(NFT_NAMESPACE, f'{image_digest}.spec.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def submit_certificate_render(spec, image_digest):
+    """
+    Render a certificate image in the process pool unless it exists or is already rendering
+
+    Returns:
+        concurrent.futures.Future: Render future, or None if the image already exists
+
+    Raises:
+        RenderQueueFull: If MAX_PENDING_RENDERS renders are already pending
+    """
+    path = certificate_image_path(image_digest)
+    if os.path.exists(path):
+        return None
+
+    with _in_flight_lock:
+        future = _in_flight.get(image_digest)
+        if future is not None:
+            return future
+        if len(_in_flight) >= MAX_PENDING_RENDERS:
+            raise RenderQueueFull(f"{len(_in_flight)} certificate renders pending")
+        template = get_template(spec['template'])
+        pool = get_process_pool()
+        try:
+            future = pool.submit(render_certificate_to_file, template, spec, path)
+        except BrokenProcessPool:
+            # A render worker died earlier; start a fresh pool for this and later renders
+            discard_process_pool(pool)
+            future = get_process_pool().submit(render_certificate_to_file, template, spec, path)
+        _in_flight[image_digest] = future
+
+    # Outside the lock: the callback runs immediately if the render already finished
+    future.add_done_callback(lambda f: _render_done(image_digest, f))
+    return future
+
+def _render_done(image_digest, future):
+    with _in_flight_lock:
+        _in_flight.pop(image_digest, None)
+    if future.cancelled():
+        return
+    if future.exception() is not None:
+        logger.error("Certificate render failed for %s: %s", image_digest, str(future.exception()))
+
+def render_queue_full():
+    """
+    Check whether MAX_PENDING_RENDERS certificate renders are already pending
+    """
+    return len(_in_flight) >= MAX_PENDING_RENDERS
+
+def prepare_certificate(template, recipient, sender, amount, message, assets_url):
+    """
+    Create (or reuse) the metadata of a certificate and start rendering its image
+
+    Returns immediately: the image renders in the process pool and is served
+    from its immutable URL once ready. When the render queue is full the image
+    is rendered on its first request instead.
+
+    Args:
+        template (dict): Certificate template
+        recipient (str): Recipient username
+        sender (str): Sender username
+        amount (float): SOL amount
+        message (str): Regard message
+        assets_url (str): Public base URL of /api/nft/assets
+
+    Returns:
+        dict: metadata, metadataUri, image URI and both digests
+    """
+    spec, image_digest = build_render_spec(template['id'], recipient, sender, amount, message)
+    store_render_spec(spec, image_digest)
+    try:
+        submit_certificate_render(spec, image_digest)
+    except RenderQueueFull:
+        logger.warning("Render queue full, certificate %s renders on first request", image_digest)
+
+    image_url = f"{assets_url}/{image_digest}.png"
+    metadata = build_certificate_metadata(template, spec, image_url)
+    metadata_digest = store_certificate_metadata(metadata)
+
+    return {
+        'metadata': metadata,
+        'metadataUri': f"{assets_url}/{metadata_digest}.json",
+        'image': image_url,
+        'metadataDigest': metadata_digest,
+        'imageDigest': image_digest
+    }
+
+def wait_for_certificate(image_digest, timeout):
+    """
+    Make sure a certificate image exists, waiting at most `timeout` seconds
+
+    Render failures and a full render queue are logged and reported as
+    still rendering; the image is rendered again on a later request.
+
+    Returns:
+        str: Image path, or None if the image is unknown or still rendering
+    """
+    path = certificate_image_path(image_digest)
+    if os.path.exists(path):
+        return path
+
+    spec = load_render_spec(image_digest)
+    if spec is None or get_template(spec['template']) is None:
+        return None
+
+    try:
+        future = submit_certificate_render(spec, image_digest)
+        if future is not None:
+            future.result(timeout=timeout)
+    except FutureTimeoutError:
+        return None
+    except RenderQueueFull as e:
+        logger.warning("Certificate %s not rendered: %s", image_digest, str(e))
+        return None
+    except Exception as e:
+        # The render itself failed, or a worker died (BrokenProcessPool; the
+        # next submit replaces the pool)
+        logger.error("Certificate render failed for %s: %s", image_digest, str(e))
+        return None
+    return path if os.path.exists(path) else None
+
+def _hex_to_rgb(value):
+    value = value.lstrip('#')
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+def _font(size):
+    from PIL import ImageFont
+    for name in ('DejaVuSans-Bold.ttf', 'DejaVuSans.ttf', 'Arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def render_certificate_to_file(template, spec, path):
+    """
+    Render a certificate PNG and write it to `path`
+
+    Runs inside the process pool, so it only takes picklable arguments.
+    """
+    from PIL import Image, ImageDraw
+
+    width, height = CERTIFICATE_SIZE
+    colors = template['colors']
+    top, bottom = (_hex_to_rgb(color) for color in colors['background'])
+    accent = _hex_to_rgb(colors['accent'])
+    text_color = _hex_to_rgb(colors['text'])
+
+    # Vertical gradient background
+    image = Image.new('RGB', CERTIFICATE_SIZE)
+    draw = ImageDraw.Draw(image)
+    for y in range(height):
+        ratio = y / (height - 1)
+        draw.line(
+            [(0, y), (width, y)],
+            fill=tuple(int(top[i] + (bottom[i] - top[i]) * ratio) for i in range(3))
+        )
+
+    draw.rectangle([30, 30, width - 30, height - 30], outline=accent, width=6)
+
+    def centered(text, y, font, fill):
+        left, _, right, _ = draw.textbbox((0, 0), text, font=font)
+        draw.text(((width - (right - left)) / 2, y), text, font=font, fill=fill)
+
+    centered(template['name'].upper(), 90, _font(48), accent)
+    centered(f"Presented to @{spec['recipient']}", 190, _font(40), text_color)
+
+    message_font = _font(30)
+    y = 290
+    for line in textwrap.wrap(spec['message'], width=55)[:6]:
+        centered(line, y, message_font, text_color)
+        y += 42
+
+    centered(f"{spec['amount']:g} SOL", height - 210, _font(44), accent)
+    if spec['sender']:
+        centered(f"with gratitude from @{spec['sender']}", height - 140, _font(28), text_color)
+
+    buffer = BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    write_atomic(path, buffer.getvalue())
+    return path
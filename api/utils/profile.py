@@ -1,4 +1,21 @@
 import hashlib
+import os
+from io import BytesIO
+from concurrent.futures.process import BrokenProcessPool
+from api.utils.storage import content_digest, media_path, write_atomic
+from api.utils.workers import get_process_pool, discard_process_pool
+
+# Media namespace of uploaded profile images
+AVATAR_NAMESPACE = 'avatars'
+# Square variants generated for every upload (pixels)
+AVATAR_SIZES = (40, 96, 256)
+AVATAR_FORMATS = {'webp': 'WEBP', 'png': 'PNG'}
+# Variant used as the user's main profileImage
+AVATAR_DEFAULT_SIZE = 256
+# Accepted source formats and limits
+AVATAR_SOURCE_FORMATS = ('PNG', 'JPEG', 'WEBP', 'GIF')
+AVATAR_MAX_BYTES = int(os.environ.get('PROFILE_IMAGE_MAX_BYTES', 5 * 1024 * 1024))
+AVATAR_MAX_PIXELS = 40_000_000
 
 def get_placeholder_image(username):
     """
@@ -34,22 +51,139 @@ def get_placeholder_image(username):
     
     return f"{base_url}?{'&'.join(params)}"
 
-def get_profile_image(user):
+def get_profile_image(user, size=None):
     """
     Get a profile image URL for a user, using a placeholder if none exists
     
     Args:
         user (dict): User object with username and profileImage fields
+        size (int): Display size in pixels; picks the smallest uploaded variant that covers it
         
     Returns:
         str: Profile image URL (user's image or placeholder)
     """
     if not user or 'username' not in user:
         return get_placeholder_image("user")
+    
+    # Prefer a resized variant when the caller knows how large it renders
+    variants = user.get('profileImageVariants')
+    if size and variants:
+        for variant_size in sorted(int(key) for key in variants):
+            if variant_size >= size:
+                return variants[str(variant_size)]['webp']
         
     # If user has a profile image, use it
     if user.get('profileImage'):
         return user['profileImage']
     
     # Otherwise, generate a placeholder based on username
-    return get_placeholder_image(user['username']) 
\ No newline at end of file
+    return get_placeholder_image(user['username'])
+
+def avatar_filename(digest, size, extension):
+    return f"{digest}-{size}.{extension}"
+
+def render_avatar_variants(data, digest):
+    """
+    Validate an uploaded image and write its resized variants
+    
+    Runs inside the process pool, so decoding and resizing never block a
+    request worker.
+    
+    Args:
+        data (bytes): Uploaded image
+        digest (str): Content digest of the upload
+        
+    Returns:
+        str: None on success, otherwise a validation error message
+    
+    Raises:
+        OSError: If a variant can't be written to storage
+    """
+    from PIL import Image, ImageOps
+    
+    Image.MAX_IMAGE_PIXELS = AVATAR_MAX_PIXELS
+    try:
+        with Image.open(BytesIO(data)) as probe:
+            if probe.format not in AVATAR_SOURCE_FORMATS:
+                return "Unsupported image format"
+            probe.verify()
+        image = Image.open(BytesIO(data))
+        image.load()
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        return "Image dimensions are too large"
+    except Exception:
+        return "File is not a valid image"
+    
+    # Encode every variant before writing, so image errors (corrupt EXIF,
+    # odd modes) are reported as invalid uploads and only storage errors raise
+    variants = {}
+    try:
+        # Respect camera orientation, then crop to a centered square
+        image = ImageOps.exif_transpose(image).convert('RGBA')
+        side = min(image.size)
+        image = ImageOps.fit(image, (side, side), method=Image.LANCZOS)
+        
+        for size in AVATAR_SIZES:
+            variant = image.resize((size, size), Image.LANCZOS) if side > size else image
+            for extension, pil_format in AVATAR_FORMATS.items():
+                buffer = BytesIO()
+                if pil_format == 'WEBP':
+                    variant.save(buffer, format=pil_format, quality=85, method=6)
+                else:
+                    variant.save(buffer, format=pil_format, optimize=True)
+                variants[avatar_filename(digest, size, extension)] = buffer.getvalue()
+    except Exception:
+        return "File is not a valid image"
+    
+    for filename, content in variants.items():
+        write_atomic(media_path(AVATAR_NAMESPACE, filename), content)
+    
+    return None
+
+def ingest_profile_image(data, timeout=30):
+    """
+    Store the resized variants of an uploaded profile image
+    
+    Variants are content-addressed, so re-uploading the same image reuses the
+    stored files without rendering again.
+    
+    Args:
+        data (bytes): Uploaded image
+        timeout (float): Seconds to wait for the render pool
+        
+    Returns:
+        tuple: (digest, error message or None)
+    
+    Raises:
+        concurrent.futures.TimeoutError: If the render takes longer than `timeout`
+        BrokenProcessPool: If a render worker died
+        OSError: If the variants can't be stored
+    """
+    digest = content_digest(data)
+    last_variant = media_path(AVATAR_NAMESPACE, avatar_filename(digest, AVATAR_SIZES[-1], 'png'))
+    if os.path.exists(last_variant):
+        return digest, None
+    
+    pool = get_process_pool()
+    try:
+        future = pool.submit(render_avatar_variants, data, digest)
+    except BrokenProcessPool:
+        # A worker died during an earlier render; start a fresh pool
+        discard_process_pool(pool)
+        future = get_process_pool().submit(render_avatar_variants, data, digest)
+    return digest, future.result(timeout=timeout)
+
+def avatar_variant_urls(digest, base_url):
+    """
+    Build the variant URL map stored as profileImageVariants
+    
+    Returns:
+        dict: {"<size>": {"webp": url, "png": url}}
+    """
+    return {
+        str(size): {
+            extension: f"{base_url}/{avatar_filename(digest, size, extension)}"
+            for extension in AVATAR_FORMATS
+        }
+        for size in AVATAR_SIZES
+    }
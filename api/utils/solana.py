@@ -1,38 +1,292 @@
+import contextvars
 import json
+import logging
 import os
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import base58
 from nacl.signing import VerifyKey
 from nacl.exceptions import BadSignatureError
 import base64
+from api.middleware.deadline import bounded_timeout, remaining_time, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the latency / error-rate moving averages
+EWMA_ALPHA = 0.2
+# Latency assumed for endpoints that have not answered yet (seconds)
+DEFAULT_LATENCY = 0.5
+# How long an endpoint is skipped after a 429 without Retry-After (seconds)
+RATE_LIMIT_COOLDOWN = 10
+
+class RpcError(Exception):
+    """Raised when no RPC endpoint could answer a request"""
+
+# Placeholder returned by get_transactions for an item the RPC answered with an
+# error (rate limit, pruned history) or left out of the batch response
+TRANSACTION_UNAVAILABLE = object()
+
+class RpcEndpoint:
+    """
+    A single Solana RPC endpoint and its observed health
+    """
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+        self.latency = None
+        self.error_rate = 0.0
+        self.rate_limited = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+    
+    def record_success(self, latency):
+        with self._lock:
+            self.latency = latency if self.latency is None else (
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+            )
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate
+    
+    def record_error(self, retry_after=None):
+        with self._lock:
+            self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+            if retry_after is not None:
+                self.rate_limited += 1
+                self.cooldown_until = time.monotonic() + retry_after
+    
+    def score(self):
+        """
+        Expected cost of sending a request here (lower is better)
+        """
+        if time.monotonic() < self.cooldown_until:
+            return float('inf')
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return latency * (1 + 10 * self.error_rate)
+    
+    def stats(self):
+        return {
+            'url': self.url.split('?')[0],  # Don't expose API keys passed as query parameters
+            'latencyMs': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'errorRate': round(self.error_rate, 3),
+            'rateLimited': self.rate_limited,
+            'coolingDown': time.monotonic() < self.cooldown_until
+        }
+
+class SolanaClient:
+    """
+    JSON-RPC client over a pool of endpoints
+    
+    Every call goes to the healthiest endpoint (EWMA latency weighted by error
+    rate) and fails over to the next one on network errors, non-2xx
+    responses and bodies that are not JSON. Calls made with hedge=True are
+    duplicated to the second-best endpoint once they take longer than
+    `hedge_after` seconds, and the first answer wins.
+    
+    Inside a request, every HTTP call is capped at the time left in the
+    request's deadline (see api.middleware.deadline).
+    """
+    def __init__(self, rpc_urls, timeout=10, hedge_after=None):
+        self.endpoints = [RpcEndpoint(url) for url in rpc_urls]
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get('SOLANA_RPC_HEDGE_WORKERS', 8)),
+            thread_name_prefix='solana-rpc'
+        )
+        logger.info("Initialized Solana client with %d endpoint(s)", len(self.endpoints))
+    
+    def _ranked_endpoints(self):
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.score())
+    
+    def _post(self, endpoint, payload):
+        started = time.monotonic()
+        try:
+            response = endpoint.session.post(endpoint.url, json=payload, timeout=bounded_timeout(self.timeout))
+        except requests.RequestException:
+            endpoint.record_error()
+            raise
+        
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            endpoint.record_error(float(retry_after) if retry_after and retry_after.isdigit() else RATE_LIMIT_COOLDOWN)
+            raise RpcError(f"Rate limited by {endpoint.url.split('?')[0]}")
+        if not 200 <= response.status_code < 300:
+            endpoint.record_error()
+            raise RpcError(f"HTTP {response.status_code} from {endpoint.url.split('?')[0]}")
+        try:
+            body = response.json()
+        except ValueError:
+            endpoint.record_error()
+            raise RpcError(f"Invalid JSON from {endpoint.url.split('?')[0]}")
+        
+        endpoint.record_success(time.monotonic() - started)
+        return body
+    
+    def _call_with_failover(self, payload, endpoints):
+        last_error = None
+        for endpoint in endpoints:
+            try:
+                return self._post(endpoint, payload)
+            except (requests.RequestException, RpcError, ValueError) as e:
+                method = payload.get('method') if isinstance(payload, dict) else 'batch'
+                logger.warning("Solana RPC %s failed on %s: %s",
+                               method, endpoint.url.split('?')[0], str(e))
+                last_error = e
+        # Report a spent request budget as such rather than as an RPC failure
+        remaining_time()
+        raise RpcError(f"All RPC endpoints failed: {last_error}")
+    
+    def _submit(self, payload, endpoints):
+        # Each task runs in its own copy of the caller's context so it keeps the request deadline
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._call_with_failover, payload, endpoints)
+    
+    def _call_hedged(self, payload, endpoints):
+        primary, backups = endpoints[0], endpoints[1:]
+        futures = [self._submit(payload, [primary])]
+        done, _ = wait(futures, timeout=bounded_timeout(self.hedge_after))
+        if done and futures[0].exception() is None:
+            return futures[0].result()
+        
+        # Primary is slow or failed: race the backups against it
+        futures.append(self._submit(payload, backups))
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=remaining_time(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded("Request deadline exceeded waiting for Solana RPC")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+        raise RpcError(f"All RPC endpoints failed: {last_error}")
+    
+    def call(self, method, params, hedge=False):
+        """
+        Send a JSON-RPC request
+        
+        Args:
+            method (str): RPC method name
+            params (list): RPC parameters
+            hedge (bool): Allow a hedged duplicate request to a second endpoint
+            
+        Returns:
+            dict: Decoded JSON-RPC response
+        """
+        payload = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": method,
+            "params": params
+        }
+        endpoints = self._ranked_endpoints()
+        if hedge and self.hedge_after is not None and len(endpoints) > 1:
+            return self._call_hedged(payload, endpoints)
+        return self._call_with_failover(payload, endpoints)
+    
+    def call_batch(self, calls):
+        """
+        Send several JSON-RPC requests in one HTTP round trip
+        
+        Args:
+            calls (list): (method, params) tuples
+            
+        Returns:
+            list: Decoded responses in the same order as `calls`
+        """
+        if not calls:
+            return []
+        payload = [
+            {"jsonrpc": "2.0", "id": index, "method": method, "params": params}
+            for index, (method, params) in enumerate(calls)
+        ]
+        responses = self._call_with_failover(payload, self._ranked_endpoints())
+        if not isinstance(responses, list):
+            raise RpcError(f"Batch request rejected: {responses.get('error')}")
+        by_id = {response.get('id'): response for response in responses}
+        return [by_id.get(index, {}) for index in range(len(calls))]
+    
+    def get_transaction(self, signature):
+        return self.call(
+            "getTransaction",
+            [signature, {"encoding": "json", "maxSupportedTransactionVersion": 0}],
+            hedge=True
+        )
+    
+    def get_transactions(self, signatures, commitment="finalized"):
+        """
+        Fetch several transactions with a single batched request
+        
+        Returns:
+            list: Transaction results in signature order: None where not found,
+                  TRANSACTION_UNAVAILABLE where the item failed or is missing
+        """
+        options = {"encoding": "json", "maxSupportedTransactionVersion": 0, "commitment": commitment}
+        responses = self.call_batch([("getTransaction", [signature, options]) for signature in signatures])
+        results = []
+        for signature, response in zip(signatures, responses):
+            if 'error' in response or 'result' not in response:
+                logger.warning("getTransaction %s unavailable: %s", signature, response.get('error', 'missing from batch'))
+                results.append(TRANSACTION_UNAVAILABLE)
+            else:
+                results.append(response['result'])
+        return results
+    
+    def get_signatures_for_address(self, address, until=None, before=None, limit=1000, commitment="finalized"):
+        """
+        List signatures involving an address, newest first
+        
+        Args:
+            address (str): Account address
+            until (str): Stop at (and exclude) this signature
+            before (str): Start below this signature
+            limit (int): Page size (max 1000)
+            
+        Returns:
+            list: Signature entries ({signature, slot, err, blockTime, ...})
+        """
+        options = {"limit": limit, "commitment": commitment}
+        if until:
+            options["until"] = until
+        if before:
+            options["before"] = before
+        response = self.call("getSignaturesForAddress", [address, options])
+        if response.get('error'):
+            raise RpcError(f"getSignaturesForAddress failed: {response['error']}")
+        return response.get('result') or []
+    
+    def stats(self):
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+_client = None
+_client_lock = threading.Lock()
 
 def get_solana_client():
     """
-    Get a Solana RPC client connection
+    Get the shared Solana RPC client
+    
+    Endpoints come from SOLANA_RPC_URLS (comma-separated) or SOLANA_RPC_URL.
+    SOLANA_RPC_TIMEOUT sets the per-request timeout in seconds and
+    SOLANA_RPC_HEDGE_MS enables hedged getTransaction calls after that many
+    milliseconds.
     """
-    class SolanaClient:
-        def __init__(self, rpc_url):
-            self.rpc_url = rpc_url
-            print(f"Initialized Solana client with URL: {rpc_url}")
-        
-        def get_transaction(self, signature):
-            headers = {
-                "Content-Type": "application/json"
-            }
-            data = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "getTransaction",
-                "params": [
-                    signature,
-                    {"encoding": "json", "maxSupportedTransactionVersion": 0}
-                ]
-            }
-            response = requests.post(self.rpc_url, headers=headers, json=data)
-            return response.json()
-    
-    rpc_url = os.environ.get('SOLANA_RPC_URL', 'https://api.devnet.solana.com')
-    return SolanaClient(rpc_url)
+    global _client
+    if _client is not None:
+        return _client
+    
+    with _client_lock:
+        if _client is None:
+            urls = os.environ.get('SOLANA_RPC_URLS') or os.environ.get('SOLANA_RPC_URL', 'https://api.devnet.solana.com')
+            rpc_urls = [url.strip() for url in urls.split(',') if url.strip()]
+            hedge_ms = os.environ.get('SOLANA_RPC_HEDGE_MS')
+            _client = SolanaClient(
+                rpc_urls,
+                timeout=float(os.environ.get('SOLANA_RPC_TIMEOUT', 10)),
+                hedge_after=int(hedge_ms) / 1000 if hedge_ms else None
+            )
+    return _client
 
 def verify_wallet_signature(wallet_address, signature, message):
     """
@@ -64,6 +318,41 @@ def verify_wallet_signature(wallet_address, signature, message):
         print(f"Signature verification error: {str(e)}")
         return False
 
+def parse_incoming_transfer(transaction, receiver):
+    """
+    Extract the SOL credited to `receiver` by a confirmed transaction
+    
+    Args:
+        transaction (dict): getTransaction result (json encoding)
+        receiver (str): Receiving wallet address
+        
+    Returns:
+        dict: {sender, amount, fee} with SOL amounts, or None if the transaction
+              failed or did not credit the receiver
+    """
+    if not transaction:
+        return None
+    
+    meta = transaction.get('meta') or {}
+    if meta.get('err') is not None or 'postBalances' not in meta or 'preBalances' not in meta:
+        return None
+    
+    accounts = transaction.get('transaction', {}).get('message', {}).get('accountKeys', [])
+    if receiver not in accounts:
+        return None
+    
+    receiver_idx = accounts.index(receiver)
+    received = meta['postBalances'][receiver_idx] - meta['preBalances'][receiver_idx]
+    if received <= 0 or receiver_idx == 0:
+        return None
+    
+    # The fee payer (first account) signs and funds wallet transfers
+    return {
+        'sender': accounts[0],
+        'amount': received / 1_000_000_000,
+        'fee': meta.get('fee', 0) / 1_000_000_000
+    }
+
 def verify_transaction(signature, expected_sender, expected_receiver, expected_amount):
     """
     Verify a Solana transaction
@@ -124,6 +413,8 @@ def verify_transaction(signature, expected_sender, expected_receiver, expected_a
             return amount_matches and sender_matches
         
         return False
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Transaction verification error: {str(e)}")
         return False
\ No newline at end of file
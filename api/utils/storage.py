@@ -0,0 +1,86 @@
+import hashlib
+import os
+import re
+import tempfile
+from flask import request, send_file
+
+# Root directory of generated media (NFT metadata and images, avatars)
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT') or os.path.join(tempfile.gettempdir(), 'dropregards-media')
+
+# One year: content-addressed files never change under the same name
+IMMUTABLE_MAX_AGE = 31536000
+
+_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+def content_digest(data):
+    """
+    Get the SHA-256 hex digest used to address stored content
+
+    Args:
+        data (bytes): Content to hash
+
+    Returns:
+        str: Hex digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+def is_valid_digest(value):
+    """
+    Check that a value is a content digest (and therefore safe in a file path)
+    """
+    return bool(value) and bool(_DIGEST_PATTERN.match(value))
+
+def media_path(namespace, filename):
+    """
+    Get the path of a stored file, creating its directory if needed
+
+    Args:
+        namespace (str): Media namespace (e.g. "nft", "avatars")
+        filename (str): File name inside the namespace
+
+    Returns:
+        str: Absolute file path
+    """
+    directory = os.path.join(MEDIA_ROOT, namespace)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+def write_atomic(path, data):
+    """
+    Write a file so readers only ever see complete content
+
+    Concurrent writers of the same content-addressed file are harmless: the
+    last rename wins with identical bytes.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def public_api_url(path):
+    """
+    Build an absolute API URL for stored media
+
+    Set PUBLIC_API_URL (e.g. https://api.example.com/api) so URLs stay
+    identical whichever host served the request.
+
+    Args:
+        path (str): Path below /api (e.g. "/nft/assets")
+    """
+    api_url = os.environ.get('PUBLIC_API_URL') or request.url_root.rstrip('/') + '/api'
+    return f"{api_url.rstrip('/')}{path}"
+
+def send_immutable_file(path, mimetype):
+    """
+    Serve a content-addressed file with long-lived immutable caching headers
+    """
+    response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE, conditional=True)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
@@ -0,0 +1,237 @@
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import os
+import socket
+import ssl
+import time
+from urllib.parse import urlparse
+
+# Header carrying "t=<unix time>,v1=<hex HMAC-SHA256 of '<t>.<body>'>"
+SIGNATURE_HEADER = 'X-DropRegards-Signature'
+# Header carrying the regard ID, so receivers can drop redeliveries
+EVENT_ID_HEADER = 'X-DropRegards-Event-Id'
+# Signatures older than this are rejected by verify_signature (seconds)
+SIGNATURE_TOLERANCE = 300
+
+DISCORD_HOSTS = ('discord.com', 'discordapp.com')
+# Bytes of a response body read before the connection is closed
+MAX_RESPONSE_BYTES = 4096
+
+class UnsafeDestination(ValueError):
+    """Raised when a webhook host resolves to an address that must not be contacted"""
+
+class WebhookDeliveryError(Exception):
+    """Raised when a destination does not accept a delivery"""
+
+def _allow_insecure():
+    # Development only: plain HTTP and private addresses, for local sinks
+    return os.environ.get('WEBHOOK_ALLOW_INSECURE', 'false').lower() == 'true'
+
+def _is_public_address(address):
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (
+        ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_multicast
+        or ip.is_reserved or ip.is_unspecified
+    )
+
+def resolve_destination(hostname, port):
+    """
+    Resolve a webhook host and check every address it points to
+
+    Loopback, private, link-local (cloud metadata), multicast and reserved
+    addresses are rejected unless WEBHOOK_ALLOW_INSECURE is set. All
+    addresses must pass, so a host can't mix a public and an internal record.
+
+    Returns:
+        str: Address to connect to
+
+    Raises:
+        UnsafeDestination: If the host doesn't resolve or resolves to a rejected address
+    """
+    try:
+        infos = socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError) as e:
+        raise UnsafeDestination(f"Could not resolve {hostname}: {e}")
+
+    addresses = [info[4][0] for info in infos]
+    if not addresses:
+        raise UnsafeDestination(f"Could not resolve {hostname}")
+    if not _allow_insecure():
+        for address in addresses:
+            if not _is_public_address(address):
+                raise UnsafeDestination(f"{hostname} resolves to a non-public address")
+    return addresses[0]
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection to an already resolved address, so DNS can't change between check and connect
+    """
+
+    def __init__(self, host, address, port, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self._address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self._address, self.port), self.timeout)
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection to an already resolved address; the certificate is still
+    verified against the hostname
+    """
+
+    def __init__(self, host, address, port, timeout):
+        super().__init__(host, port, timeout=timeout, context=ssl.create_default_context())
+        self._address = address
+
+    def connect(self):
+        sock = socket.create_connection((self._address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+def sign_payload(secret, body, timestamp=None):
+    """
+    Sign a webhook body
+
+    Args:
+        secret (str): Webhook secret
+        body (bytes): Exact request body
+        timestamp (int): Unix time of the signature (now if None)
+
+    Returns:
+        str: Value of the signature header
+    """
+    timestamp = int(timestamp or time.time())
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def verify_signature(secret, body, header, tolerance=SIGNATURE_TOLERANCE):
+    """
+    Check a signature header produced by sign_payload (for receivers and the test sink)
+
+    Returns:
+        bool: True if the signature matches and is recent
+    """
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (ValueError, KeyError, AttributeError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = sign_payload(secret, body, timestamp).split('v1=', 1)[1]
+    return hmac.compare_digest(expected, parts.get('v1', ''))
+
+def validate_webhook_url(url, webhook_type):
+    """
+    Check a webhook destination
+
+    HTTPS is required unless WEBHOOK_ALLOW_INSECURE is set (local sinks in
+    development). Discord webhooks must point at Discord.
+
+    Returns:
+        str: Error message, or None if the URL is acceptable
+    """
+    if not isinstance(url, str) or len(url) > 2048:
+        return "url must be a string of at most 2048 characters"
+    parsed = urlparse(url)
+    if parsed.scheme != 'https' and not (_allow_insecure() and parsed.scheme == 'http'):
+        return "url must use https"
+    if not parsed.hostname:
+        return "url must include a host"
+    if parsed.username or parsed.password:
+        return "url must not include credentials"
+    if webhook_type == 'discord' and (parsed.hostname not in DISCORD_HOSTS or not parsed.path.startswith('/api/webhooks/')):
+        return "Discord webhooks must be https://discord.com/api/webhooks/... URLs"
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        resolve_destination(parsed.hostname, port)
+    except ValueError as e:
+        # UnsafeDestination, or an invalid port
+        return f"url is not allowed: {e}"
+    return None
+
+def build_event(regard, event='regard.completed'):
+    """
+    Build the JSON event sent to "webhook" destinations
+    """
+    created_at = regard.get('createdAt')
+    return {
+        'id': str(regard['_id']),
+        'type': event,
+        'createdAt': created_at.isoformat() if created_at else None,
+        'data': {
+            'sender': {'username': regard.get('sender', {}).get('username')},
+            'recipient': {'username': regard.get('recipient', {}).get('username')},
+            'amount': regard.get('amount'),
+            'message': regard.get('message'),
+            'transactionSignature': regard.get('transactionSignature'),
+            'includesNft': regard.get('includesNft', False)
+        }
+    }
+
+def build_discord_message(regard):
+    """
+    Build the message posted to "discord" destinations
+    """
+    sender = regard.get('sender', {}).get('username') or 'Someone'
+    content = f"**{sender}** sent you {regard.get('amount')} SOL"
+    if regard.get('message'):
+        content += f": {regard['message']}"
+    # Discord rejects messages over 2000 characters
+    return {'content': content[:2000], 'allowed_mentions': {'parse': []}}
+
+def build_request(webhook, regard, event='regard.completed'):
+    """
+    Build the body and headers of a delivery
+
+    Returns:
+        tuple: (body bytes, headers dict)
+    """
+    payload = build_discord_message(regard) if webhook['type'] == 'discord' else build_event(regard, event)
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    headers = {
+        'Content-Type': 'application/json',
+        'User-Agent': 'DropRegards-Webhooks/1.0',
+        EVENT_ID_HEADER: str(regard['_id']),
+        SIGNATURE_HEADER: sign_payload(webhook['secret'], body)
+    }
+    return body, headers
+
+def post_webhook(url, body, headers, timeout):
+    """
+    POST a delivery to a webhook URL
+
+    The host is resolved and checked again here (DNS may have changed since
+    registration) and the connection goes to the checked address. Redirects
+    are not followed.
+
+    Raises:
+        UnsafeDestination: If the host now resolves to a rejected address
+        WebhookDeliveryError: On a non-2xx response
+        OSError: On network errors and timeouts
+    """
+    parsed = urlparse(url)
+    secure = parsed.scheme == 'https'
+    if not secure and not (_allow_insecure() and parsed.scheme == 'http'):
+        raise UnsafeDestination("url must use https")
+    port = parsed.port or (443 if secure else 80)
+    address = resolve_destination(parsed.hostname, port)
+
+    connection_class = _PinnedHTTPSConnection if secure else _PinnedHTTPConnection
+    connection = connection_class(parsed.hostname, address, port, timeout)
+    try:
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        connection.request('POST', path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read(MAX_RESPONSE_BYTES)
+        if not 200 <= response.status < 300:
+            raise WebhookDeliveryError(f"HTTP {response.status}")
+    finally:
+        connection.close()
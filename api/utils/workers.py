@@ -0,0 +1,98 @@
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+_process_pool = None
+_process_pool_pid = None
+_thread_pool = None
+_thread_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Threads available for I/O fan-out within requests (FANOUT_WORKERS)
+FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', 16))
+
+def get_process_pool():
+    """
+    Get the shared process pool for CPU-heavy work (image rendering, resizing)
+
+    Work submitted here runs outside the request worker, so one large render
+    never stalls the requests sharing its process. The pool uses the "spawn"
+    start method (forking a threaded server process is unsafe) and is recreated
+    if the current process was forked after it was created.
+    RENDER_WORKERS sets the pool size (default: half the CPUs).
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: Shared pool
+    """
+    global _process_pool, _process_pool_pid
+    if _process_pool is not None and _process_pool_pid == os.getpid():
+        return _process_pool
+
+    with _pool_lock:
+        if _process_pool is None or _process_pool_pid != os.getpid():
+            max_workers = int(os.environ.get('RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+            _process_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _process_pool_pid = os.getpid()
+    return _process_pool
+
+def discard_process_pool(pool):
+    """
+    Drop a process pool that raised BrokenProcessPool (a worker died)
+
+    A broken pool rejects all further work, so the next get_process_pool()
+    call starts a fresh one.
+    """
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def get_thread_pool():
+    """
+    Get the shared, bounded thread pool for concurrent I/O (database sub-queries)
+
+    Returns:
+        concurrent.futures.ThreadPoolExecutor: Shared pool
+    """
+    global _thread_pool, _thread_pool_pid
+    if _thread_pool is not None and _thread_pool_pid == os.getpid():
+        return _thread_pool
+
+    with _pool_lock:
+        if _thread_pool is None or _thread_pool_pid != os.getpid():
+            _thread_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+            _thread_pool_pid = os.getpid()
+    return _thread_pool
+
+def submit_in_context(fn, *args, **kwargs):
+    """
+    Run a function on the shared thread pool in a copy of the caller's context
+
+    The request deadline and pymongo.timeout() are context variables, so the
+    sub-task keeps the caller's limits. Don't fan out inside read_your_writes():
+    a session must not be used by two threads at once.
+
+    Returns:
+        concurrent.futures.Future: Result of the call
+    """
+    context = contextvars.copy_context()
+    return get_thread_pool().submit(context.run, fn, *args, **kwargs)
+
+def shutdown_pools():
+    """
+    Shut down the pools owned by this process
+    """
+    global _process_pool, _thread_pool
+    with _pool_lock:
+        if _process_pool is not None and _process_pool_pid == os.getpid():
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        if _thread_pool is not None and _thread_pool_pid == os.getpid():
+            _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+        _thread_pool = None
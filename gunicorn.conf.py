@@ -0,0 +1,34 @@
+"""
+Gunicorn configuration for the DropRegards API
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker creates its own MongoDB client after fork, sized from the same
+settings (see api/db.py), warms it up before serving and closes it on exit.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+# Import the app once in the master; workers still connect after fork
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+
+# The MongoDB pool size is derived from the thread count
+os.environ.setdefault('GUNICORN_THREADS', str(threads))
+
+def post_worker_init(worker):
+    from api.db import warm_up_db
+    try:
+        warm_up_db()
+    except Exception as e:
+        # Serve anyway: requests reconnect on their own
+        worker.log.warning("MongoDB warm-up failed in worker %s: %s", worker.pid, str(e))
+
+def worker_exit(server, worker):
+    from api.db import close_db_connection
+    from api.utils.workers import shutdown_pools
+    shutdown_pools()
+    close_db_connection()
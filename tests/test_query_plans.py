@@ -0,0 +1,354 @@
+"""
+Query-plan regression checks for the model queries
+
+Seeds a scratch database with the indexes from api.db._create_indexes, calls
+every model read and write path, and captures the commands they send with a
+command listener on the test's own MongoClient. Each captured find,
+aggregate, count, update, delete or findAndModify is then re-run under
+explain("executionStats") and its winning plans (including $unionWith
+sub-pipelines) are checked:
+
+- no COLLSCAN: every plan starts from an index
+- no in-memory SORT, unless the check allows one (relevance or ranking sorts)
+- documents examined stay within a bound per document returned
+
+Needs a MongoDB server (QUERY_PLAN_MONGODB_URI, default
+mongodb://localhost:27017); the tests are skipped when none is reachable.
+
+Usage:
+    python -m pytest tests/test_query_plans.py
+"""
+import os
+import random
+from datetime import datetime, timedelta, UTC
+import pytest
+
+pytest.importorskip('pymongo')
+
+from bson import ObjectId
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+from api import db as api_db
+from api.db import get_db
+
+MONGODB_URI = os.environ.get('QUERY_PLAN_MONGODB_URI', 'mongodb://localhost:27017')
+
+SCRATCH_DB = 'dropregards_query_plans'
+# Commands whose plans are checked (inserts and index builds have none)
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+# Fields added by the driver that explain does not accept
+DRIVER_FIELDS = {
+    'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'readConcern',
+    'writeConcern', 'maxTimeMS', 'apiVersion', 'apiStrict', 'apiDeprecationErrors'
+}
+# Documents examined per document returned, unless a check sets its own bound
+DEFAULT_EXAMINED_RATIO = 2
+
+# Seed sizes: one recipient large enough that a collection scan or an unindexed
+# filter shows up in the examined counts
+HEAVY_HOT_REGARDS = 2000
+HEAVY_ARCHIVED_REGARDS = 300
+OTHER_USERS = 20
+OTHER_REGARDS_PER_USER = 100
+WORDS = ['thanks', 'great', 'stream', 'coffee', 'love', 'keep', 'going', 'amazing', 'work', 'cheers']
+
+class CommandCapture(monitoring.CommandListener):
+    """
+    Command listener recording the explainable commands sent to the scratch database
+    """
+
+    def __init__(self):
+        self.active = False
+        self.commands = []
+
+    def start(self):
+        self.commands = []
+        self.active = True
+
+    def stop(self):
+        self.active = False
+        return self.commands
+
+    def started(self, event):
+        if self.active and event.database_name == SCRATCH_DB and event.command_name in EXPLAINABLE_COMMANDS:
+            command = {key: value for key, value in event.command.items() if key not in DRIVER_FIELDS}
+            self.commands.append((event.command_name, command))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+class Check:
+    """
+    A model call and the plan properties its queries must have
+
+    Args:
+        name (str): Label used in the report
+        run (callable): Called with the seed summary; issues the queries
+        allow_sort (bool): Accept an in-memory SORT stage
+        examined_ratio (float): Documents examined per document returned
+        max_examined (callable): Absolute bound from the seed summary, for
+            aggregations that return fewer documents than they must read
+    """
+
+    def __init__(self, name, run, allow_sort=False, examined_ratio=DEFAULT_EXAMINED_RATIO, max_examined=None):
+        self.name = name
+        self.run = run
+        self.allow_sort = allow_sort
+        self.examined_ratio = examined_ratio
+        self.max_examined = max_examined
+
+def _regard(sender, recipient, created_at, status='completed', message=None, nft=False):
+    regard = {
+        '_id': ObjectId(),
+        'sender': {'walletAddress': sender['walletAddress'], 'username': sender['username'],
+                   'displayName': sender['username']},
+        'recipient': {'walletAddress': recipient['walletAddress'], 'username': recipient['username']},
+        'amount': round(random.uniform(0.01, 2), 3),
+        'message': message or ' '.join(random.choices(WORDS, k=6)),
+        'transactionSignature': str(ObjectId()),
+        'status': status,
+        'includesNft': nft,
+        'createdAt': created_at
+    }
+    if nft:
+        regard['nft'] = {'design': 'classic', 'image': 'seed.png', 'name': 'Seed certificate'}
+    if status != 'completed':
+        regard['expiresAt'] = datetime.now(UTC) + timedelta(days=1)
+    return regard
+
+def seed(db):
+    """
+    Fill the scratch database and derived collections
+
+    Returns:
+        dict: Wallets, usernames, IDs and counts used by the checks
+    """
+    from api.models.rollup import rebuild_rollups
+    from api.models.sender_stats import rebuild_sender_stats
+    from api.models.trending import rebuild_trending_buckets
+
+    random.seed(42)
+    now = datetime.now(UTC)
+    users = [
+        {'walletAddress': f'Wallet{i:038d}', 'username': f'user{i}', 'displayName': f'User {i}',
+         'createdAt': now, 'updatedAt': now}
+        for i in range(OTHER_USERS + 1)
+    ]
+    db.users.insert_many(users)
+    heavy, others = users[0], users[1:]
+
+    hot = []
+    for _ in range(HEAVY_HOT_REGARDS):
+        status = random.choices(['completed', 'pending', 'failed'], weights=[90, 5, 5])[0]
+        hot.append(_regard(random.choice(others), heavy, now - timedelta(minutes=random.randint(1, 60 * 24 * 60)),
+                           status, nft=random.random() < 0.2))
+    for user in others:
+        for _ in range(OTHER_REGARDS_PER_USER):
+            sender = random.choice([heavy] + [other for other in others if other is not user])
+            hot.append(_regard(sender, user, now - timedelta(minutes=random.randint(1, 60 * 24 * 60))))
+    db.regards.insert_many(hot)
+
+    archived = [
+        _regard(random.choice(others), heavy, now - timedelta(days=random.randint(400, 700)),
+                nft=random.random() < 0.2)
+        for _ in range(HEAVY_ARCHIVED_REGARDS)
+    ]
+    db.regards_archive.insert_many(archived)
+
+    rebuild_rollups()
+    rebuild_sender_stats()
+    rebuild_trending_buckets()
+
+    heavy_completed = [r for r in hot if r['recipient']['walletAddress'] == heavy['walletAddress']
+                       and r['status'] == 'completed']
+    # Bound for the search: the recipient's regards containing the term, in any status
+    search_matches = [r for r in hot if r['recipient']['walletAddress'] == heavy['walletAddress']
+                      and 'coffee' in r['message'].split()]
+    newest_sent = max((r for r in hot if r['sender']['walletAddress'] == heavy['walletAddress']),
+                      key=lambda r: (r['createdAt'], r['_id']))
+    return {
+        'heavy': heavy,
+        'sender': others[0],
+        'heavy_hot_completed': len(heavy_completed),
+        'heavy_completed': len(heavy_completed) + len(archived),
+        'search_matches': len(search_matches),
+        'trending_buckets': db.trending_hourly.count_documents({'hour': {'$gte': now - timedelta(days=31)}}),
+        'hot_id': str(heavy_completed[0]['_id']),
+        'archived_id': str(archived[0]['_id']),
+        'sent_after': (newest_sent['createdAt'], str(newest_sent['_id'])),
+        'usernames': [user['username'] for user in others[:5]]
+    }
+
+def build_checks():
+    """
+    List the checks covering every model query
+    """
+    from api.models import user, regard, rollup, sender_stats, trending, outbox, webhook
+
+    def consume_export(s):
+        regards = regard.iter_regards_by_recipient(s['heavy']['walletAddress'])
+        next(regards, None)
+        regards.close()
+
+    def complete_regard(s):
+        regard.create_regard(_regard(s['sender'], s['heavy'], datetime.now(UTC)), notify=True)
+
+    def dispatch_outbox(s):
+        # Inserts are not explained, so the due entry is written directly
+        due = _regard(s['sender'], s['heavy'], datetime.now(UTC))
+        due['outbox'] = outbox.new_outbox_entry()
+        get_db().regards.insert_one(due)
+        lease_id, regards = outbox.claim_due_events(100, 60)
+        outbox.record_delivery_results([(r['_id'], [], None, 1) for r in regards], lease_id)
+
+    now = datetime.now(UTC)
+    return [
+        Check('users: by wallet', lambda s: user.find_user_by_wallet(s['heavy']['walletAddress'])),
+        Check('users: by username', lambda s: user.find_user_by_username(s['heavy']['username'])),
+        Check('users: by usernames', lambda s: user.find_users_by_usernames(s['usernames'])),
+        Check('users: username exists', lambda s: user.username_exists(s['heavy']['username'])),
+        Check('users: update', lambda s: user.update_user(s['heavy']['walletAddress'], {'bio': 'seed'})),
+        Check('regards: received, first page',
+              lambda s: regard.get_regards_by_recipient(s['heavy']['walletAddress'], 10, 0)),
+        # Starts exactly past the hot results: the hot query reads the regards it
+        # skips (offset paging), the archive query skips nothing
+        Check('regards: received, archive page',
+              lambda s: regard.get_regards_by_recipient(s['heavy']['walletAddress'], 10, s['heavy_hot_completed']),
+              max_examined=lambda s: s['heavy_hot_completed'] + 10),
+        Check('regards: sent, first page',
+              lambda s: regard.get_regards_by_sender(s['heavy']['walletAddress'], 10)),
+        Check('regards: sent, next page',
+              lambda s: regard.get_regards_by_sender(s['heavy']['walletAddress'], 10, s['sent_after'])),
+        # Relevance order comes from the text score, which no index can provide;
+        # only the recipient's matching regards may be read
+        Check('regards: search',
+              lambda s: regard.search_regards_by_recipient(s['heavy']['walletAddress'], 'coffee', 10),
+              allow_sort=True, max_examined=lambda s: s['search_matches']),
+        Check('regards: export', consume_export),
+        Check('regards: stats', lambda s: regard.get_regard_stats(s['heavy']['walletAddress']),
+              max_examined=lambda s: s['heavy_completed']),
+        Check('regards: NFT collection',
+              lambda s: regard.get_nft_regards_by_recipient(s['heavy']['walletAddress'])),
+        Check('regards: by id', lambda s: regard.get_regard_by_id(s['hot_id'])),
+        Check('regards: archived by id', lambda s: regard.get_regard_by_id(s['archived_id'])),
+        Check('regards: create and update derived data', complete_regard),
+        Check('outbox: claim and record deliveries', dispatch_outbox),
+        Check('webhooks: by wallets', lambda s: webhook.get_webhooks_by_wallets([s['heavy']['walletAddress']])),
+        Check('webhooks: list', lambda s: webhook.list_webhooks(s['heavy']['walletAddress'])),
+        Check('rollups: time series',
+              lambda s: rollup.get_regard_timeseries(s['heavy']['walletAddress'], now - timedelta(days=90), now)),
+        Check('sender stats: get', lambda s: sender_stats.get_sender_stats(s['heavy']['walletAddress'])),
+        # The ranking sorts grouped buckets; the bucket scan itself is indexed
+        Check('trending: top recipients', lambda s: trending.compute_top_recipients(24 * 30),
+              allow_sort=True, max_examined=lambda s: s['trending_buckets']),
+    ]
+
+def _plan_stages(plan):
+    """
+    Collect the stage names of a winning plan tree
+    """
+    if 'queryPlan' in plan:
+        # Slot-based engine: the classic-style tree is under queryPlan
+        plan = plan['queryPlan']
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages += _plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        stages += _plan_stages(child)
+    return stages
+
+def _query_layers(explain):
+    """
+    Find every (queryPlanner, executionStats) pair in an explain document,
+    including $cursor stages and $unionWith sub-pipelines
+    """
+    if isinstance(explain, dict):
+        if 'queryPlanner' in explain:
+            yield explain['queryPlanner'], explain.get('executionStats', {})
+        for key, value in explain.items():
+            if key not in ('queryPlanner', 'executionStats'):
+                yield from _query_layers(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from _query_layers(value)
+
+def check_plan(check, explain, summary):
+    """
+    Check the plans of one explained command
+
+    Returns:
+        list: Failure messages (empty if the plans are acceptable)
+    """
+    failures = []
+    layers = list(_query_layers(explain))
+    if not layers:
+        return ['explain returned no query plan']
+
+    for planner, stats in layers:
+        namespace = planner.get('namespace', '?')
+        stages = _plan_stages(planner['winningPlan'])
+        if 'COLLSCAN' in stages:
+            failures.append(f"{namespace}: collection scan ({' <- '.join(filter(None, stages))})")
+        if 'SORT' in stages and not check.allow_sort:
+            failures.append(f"{namespace}: in-memory SORT ({' <- '.join(filter(None, stages))})")
+
+        examined = stats.get('totalDocsExamined', 0)
+        returned = stats.get('nReturned', 0)
+        if check.max_examined:
+            limit = check.max_examined(summary)
+        else:
+            limit = check.examined_ratio * max(returned, 1)
+        if examined > limit:
+            failures.append(f"{namespace}: examined {examined} documents for {returned} returned (limit {limit:g})")
+    return failures
+
+@pytest.fixture(scope='module')
+def scratch():
+    """
+    Seed the scratch database and point api.db at it
+
+    Yields:
+        tuple: (database, CommandCapture, seed summary)
+    """
+    capture = CommandCapture()
+    # The listener is scoped to this client, so only the checks' commands are seen
+    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=2000, event_listeners=[capture])
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"No MongoDB server at {MONGODB_URI}: {e}")
+
+    client.drop_database(SCRATCH_DB)
+    db = client[SCRATCH_DB]
+    try:
+        with pytest.MonkeyPatch.context() as patch:
+            # Model functions take their handles from get_db(); hand out the scratch database
+            patch.setattr(api_db, '_db', db)
+            patch.setattr(api_db, '_db_pid', os.getpid())
+            api_db._role_handles.clear()
+            api_db._create_indexes(db)
+            yield db, capture, seed(db)
+    finally:
+        api_db._role_handles.clear()
+        client.drop_database(SCRATCH_DB)
+        client.close()
+
+@pytest.mark.parametrize('check', build_checks(), ids=lambda check: check.name)
+def test_query_plan(scratch, check):
+    db, capture, summary = scratch
+    capture.start()
+    try:
+        check.run(summary)
+    finally:
+        commands = capture.stop()
+
+    assert commands, "issued no queries"
+    failures = []
+    for name, command in commands:
+        explain = db.command('explain', command, verbosity='executionStats')
+        failures += [f"{name}: {failure}" for failure in check_plan(check, explain, summary)]
+    assert not failures, "\n".join(failures)
@@ -0,0 +1,117 @@
+"""
+Role handles and read_your_writes() against a real MongoDB deployment
+
+Checks the read preference, read concern and write concern of each role
+handle, and that a write made on the primary inside read_your_writes() is
+seen by reads routed through the public and analytics roles in the same
+block. Run against a replica set so those reads can go to a secondary.
+
+Needs a MongoDB server (MONGO_URI); the tests are skipped when it is not set
+or does not answer.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017/?replicaSet=rs0 python -m pytest tests/test_read_your_writes.py
+"""
+import os
+import pytest
+
+pytest.importorskip('pymongo')
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from pymongo.read_preferences import ReadPreference, SecondaryPreferred
+from api import db as api_db
+from api.db import get_db, read_your_writes, current_session, ROLE_PRIMARY, ROLE_ANALYTICS, ROLE_PUBLIC
+
+MONGO_URI = os.environ.get('MONGO_URI')
+
+SCRATCH_DB = 'dropregards_read_your_writes'
+SECONDARY_ROLES = (ROLE_PUBLIC, ROLE_ANALYTICS)
+
+@pytest.fixture(scope='module')
+def scratch():
+    """
+    Point api.db at a scratch database on MONGO_URI
+
+    Yields:
+        pymongo.database.Database: Scratch database
+    """
+    if not MONGO_URI:
+        pytest.skip("MONGO_URI is not set")
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"No MongoDB server at {MONGO_URI}: {e}")
+
+    client.drop_database(SCRATCH_DB)
+    db = client[SCRATCH_DB]
+    try:
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(api_db, '_db', db)
+            patch.setattr(api_db, '_db_pid', os.getpid())
+            yield db
+    finally:
+        api_db._role_handles.clear()
+        client.drop_database(SCRATCH_DB)
+        client.close()
+
+@pytest.fixture
+def handles(scratch, monkeypatch):
+    # Handles are cached with the options read from the environment at creation
+    for name in ('MONGODB_WRITE_CONCERN', 'MONGODB_WTIMEOUT_MS', 'MONGODB_MAX_STALENESS_SECONDS'):
+        monkeypatch.delenv(name, raising=False)
+    api_db._role_handles.clear()
+    yield scratch
+    api_db._role_handles.clear()
+
+def test_primary_handle_reads_and_writes_on_the_primary(handles):
+    primary = get_db(ROLE_PRIMARY)
+
+    assert primary.read_preference == ReadPreference.PRIMARY
+    assert primary.write_concern.document == {'w': 'majority', 'wtimeout': 5000}
+
+    with read_your_writes():
+        # The primary handle is the same inside a block; only secondary reads change
+        assert get_db(ROLE_PRIMARY) is primary
+
+def test_secondary_handles_bound_staleness(handles, monkeypatch):
+    monkeypatch.setenv('MONGODB_MAX_STALENESS_SECONDS', '30')
+
+    for role in SECONDARY_ROLES:
+        handle = get_db(role)
+        assert isinstance(handle.read_preference, SecondaryPreferred)
+        # Raised to the 90 second minimum the driver accepts
+        assert handle.read_preference.max_staleness == 90
+        assert handle.read_concern.level is None
+
+def test_secondary_handles_use_majority_read_concern_in_a_block(handles):
+    outside = {role: get_db(role) for role in SECONDARY_ROLES}
+
+    with read_your_writes() as session:
+        assert current_session() is session
+        assert session.options.causal_consistency
+        for role in SECONDARY_ROLES:
+            handle = get_db(role)
+            assert handle is not outside[role]
+            assert handle.read_concern.level == 'majority'
+            assert isinstance(handle.read_preference, SecondaryPreferred)
+
+    assert current_session() is None
+    for role in SECONDARY_ROLES:
+        assert get_db(role) is outside[role]
+
+def test_reads_in_a_block_see_its_writes(handles):
+    with read_your_writes():
+        inserted = get_db().ryw_checks.insert_one({'step': 'insert'}, session=current_session())
+        for role in SECONDARY_ROLES:
+            doc = get_db(role).ryw_checks.find_one({'_id': inserted.inserted_id}, session=current_session())
+            assert doc == {'_id': inserted.inserted_id, 'step': 'insert'}
+
+        get_db().ryw_checks.update_one(
+            {'_id': inserted.inserted_id}, {'$set': {'step': 'update'}}, session=current_session()
+        )
+        for role in SECONDARY_ROLES:
+            doc = get_db(role).ryw_checks.find_one({'_id': inserted.inserted_id}, session=current_session())
+            assert doc['step'] == 'update'
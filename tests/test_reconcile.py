@@ -0,0 +1,195 @@
+"""
+Reconciliation against a stub RPC client and an in-memory database
+
+Run with `python -m pytest tests/test_reconcile.py` (needs mongomock).
+"""
+from datetime import datetime, UTC
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from api.jobs import reconcile
+from api.utils.solana import TRANSACTION_UNAVAILABLE
+
+RECIPIENT = 'Recipient1111111111111111111111111111111111'
+SENDER = 'Sender11111111111111111111111111111111111111'
+OTHER = 'Other111111111111111111111111111111111111111'
+LAMPORTS = 1_000_000_000
+
+def _transfer(payer, receiver, sol, err=None):
+    """
+    getTransaction result of a plain SOL transfer
+    """
+    lamports = int(sol * LAMPORTS)
+    return {
+        'meta': {
+            'err': err,
+            'fee': 5000,
+            'preBalances': [10 * LAMPORTS, LAMPORTS],
+            'postBalances': [10 * LAMPORTS - lamports - 5000, LAMPORTS + lamports]
+        },
+        'transaction': {'message': {'accountKeys': [payer, receiver]}}
+    }
+
+class StubClient:
+    """
+    RPC client serving canned signatures (oldest first) and transactions
+    """
+
+    def __init__(self, entries, transactions):
+        self.entries = entries
+        self.transactions = transactions
+        self.fetched = []
+
+    def get_signatures_for_address(self, address, until=None, before=None, limit=1000, commitment='finalized'):
+        assert address == RECIPIENT
+        signatures = [entry['signature'] for entry in self.entries]
+        start = signatures.index(until) + 1 if until in signatures else 0
+        return list(reversed(self.entries[start:]))[:limit]
+
+    def get_transactions(self, signatures, commitment='finalized'):
+        self.fetched.extend(signatures)
+        return [self.transactions.get(signature) for signature in signatures]
+
+def _regard(signature, sender, recipient, amount, status):
+    return {
+        'sender': {'walletAddress': sender, 'username': 'sender'},
+        'recipient': {'walletAddress': recipient, 'username': 'recipient'},
+        'amount': amount,
+        'message': 'thanks',
+        'transactionSignature': signature,
+        'status': status,
+        'createdAt': datetime.now(UTC),
+        'expiresAt': datetime.now(UTC)
+    }
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().db
+    completed = []
+    monkeypatch.setattr(reconcile, 'get_db', lambda *args: database)
+    monkeypatch.setattr(reconcile, 'on_regard_completed', lambda regard: completed.append(regard['_id']))
+    database.completed = completed
+    return database
+
+def test_reconcile_creates_repairs_and_skips(db):
+    db.regards.insert_many([
+        _regard('repaired', SENDER, RECIPIENT, 0.5, 'pending'),
+        _regard('done', SENDER, RECIPIENT, 0.25, 'completed'),
+        _regard('wrong-amount', SENDER, RECIPIENT, 2.0, 'pending'),
+        _regard('wrong-payer', SENDER, RECIPIENT, 0.1, 'pending'),
+        _regard('failed', SENDER, RECIPIENT, 0.3, 'pending'),
+        # The recipient paid someone else; that regard is not theirs to reconcile
+        _regard('outgoing', RECIPIENT, OTHER, 0.7, 'pending'),
+    ])
+    entries = [
+        {'signature': 'new', 'blockTime': 1_700_000_000, 'err': None},
+        {'signature': 'repaired', 'err': None},
+        {'signature': 'done', 'err': None},
+        {'signature': 'wrong-amount', 'err': None},
+        {'signature': 'wrong-payer', 'err': None},
+        {'signature': 'failed', 'err': {'InstructionError': [0, 'Custom']}},
+        {'signature': 'outgoing', 'err': None},
+    ]
+    client = StubClient(entries, {
+        'new': _transfer(SENDER, RECIPIENT, 1.0),
+        'repaired': _transfer(SENDER, RECIPIENT, 0.5),
+        'wrong-amount': _transfer(SENDER, RECIPIENT, 0.2),
+        'wrong-payer': _transfer(OTHER, RECIPIENT, 0.1),
+        'outgoing': _transfer(RECIPIENT, OTHER, 0.7),
+    })
+
+    summary = reconcile.reconcile_wallet({'walletAddress': RECIPIENT, 'username': 'recipient'}, client)
+
+    assert summary == {'scanned': 7, 'created': 1, 'repaired': 2, 'unfetched': 0}
+    regards = {doc['transactionSignature']: doc for doc in db.regards.find()}
+
+    created = regards['new']
+    assert created['status'] == 'completed'
+    assert created['sender']['walletAddress'] == SENDER
+    assert created['amount'] == 1.0
+    assert 'outbox' not in created
+
+    assert regards['repaired']['status'] == 'completed'
+    assert 'expiresAt' not in regards['repaired']
+    assert regards['failed']['status'] == 'failed'
+    assert 'expiresAt' in regards['failed']
+
+    # Skipped: already final, mismatched or someone else's regard
+    assert 'done' not in client.fetched
+    for signature in ('done', 'wrong-amount', 'wrong-payer', 'outgoing'):
+        assert 'reconciledAt' not in regards[signature]
+    assert regards['outgoing']['status'] == 'pending'
+
+    assert sorted(db.completed) == sorted([created['_id'], regards['repaired']['_id']])
+    assert db.reconcile_checkpoints.find_one({'walletAddress': RECIPIENT})['lastSignature'] == 'outgoing'
+
+def test_reconcile_queues_webhooks_for_recipients_with_webhooks(db):
+    client = StubClient([{'signature': 'new', 'err': None}], {'new': _transfer(SENDER, RECIPIENT, 1.0)})
+
+    reconcile.reconcile_wallet({'walletAddress': RECIPIENT, 'webhookCount': 1}, client)
+
+    assert db.regards.find_one({'transactionSignature': 'new'})['outbox']['state'] == 'pending'
+
+def test_reconcile_resumes_from_checkpoint(db):
+    client = StubClient([{'signature': 'new', 'err': None}], {'new': _transfer(SENDER, RECIPIENT, 1.0)})
+    reconcile.reconcile_wallet({'walletAddress': RECIPIENT}, client)
+
+    assert reconcile.reconcile_wallet({'walletAddress': RECIPIENT}, client) == {'scanned': 0, 'created': 0, 'repaired': 0, 'unfetched': 0}
+
+def test_reconcile_holds_checkpoint_when_transactions_are_unavailable(db, monkeypatch):
+    monkeypatch.setattr(reconcile, 'TRANSACTION_BATCH_SIZE', 2)
+    db.regards.insert_one(_regard('pending', SENDER, RECIPIENT, 0.5, 'pending'))
+    entries = [
+        {'signature': 'new', 'err': None},
+        {'signature': 'pending', 'err': None},
+        {'signature': 'later', 'err': None},
+    ]
+    # 'new' errored inside the batch and 'pending' was missing from the response
+    client = StubClient(entries, {
+        'new': TRANSACTION_UNAVAILABLE,
+        'pending': TRANSACTION_UNAVAILABLE,
+        'later': _transfer(SENDER, RECIPIENT, 1.0),
+    })
+
+    summary = reconcile.reconcile_wallet({'walletAddress': RECIPIENT}, client)
+
+    assert summary == {'scanned': 3, 'created': 0, 'repaired': 0, 'unfetched': 2}
+    pending = db.regards.find_one({'transactionSignature': 'pending'})
+    assert pending['status'] == 'pending'
+    assert 'reconciledAt' not in pending
+    assert db.regards.find_one({'transactionSignature': 'new'}) is None
+    assert 'later' not in client.fetched
+    assert db.reconcile_checkpoints.find_one({'walletAddress': RECIPIENT}) is None
+
+    # Once the RPC answers, the next run picks up from the same place
+    client.transactions.update({
+        'new': _transfer(SENDER, RECIPIENT, 2.0),
+        'pending': _transfer(SENDER, RECIPIENT, 0.5),
+    })
+    summary = reconcile.reconcile_wallet({'walletAddress': RECIPIENT}, client)
+
+    assert summary == {'scanned': 3, 'created': 2, 'repaired': 1, 'unfetched': 0}
+    assert db.regards.find_one({'transactionSignature': 'pending'})['status'] == 'completed'
+    assert db.regards.find_one({'transactionSignature': 'new'})['amount'] == 2.0
+    assert db.reconcile_checkpoints.find_one({'walletAddress': RECIPIENT})['lastSignature'] == 'later'
+
+def test_reconcile_fails_only_on_errored_entries_or_missing_transfers(db):
+    db.regards.insert_many([
+        _regard('reverted', SENDER, RECIPIENT, 0.5, 'pending'),
+        _regard('unrelated', SENDER, RECIPIENT, 0.5, 'pending'),
+        _regard('not-found', SENDER, RECIPIENT, 0.5, 'pending'),
+    ])
+    entries = [
+        {'signature': 'reverted', 'err': {'InstructionError': [0, 'Custom']}},
+        {'signature': 'unrelated', 'err': None},
+        {'signature': 'not-found', 'err': None},
+    ]
+    # 'unrelated' was fetched but pays someone else; 'not-found' returned null
+    client = StubClient(entries, {'unrelated': _transfer(SENDER, OTHER, 0.5)})
+
+    summary = reconcile.reconcile_wallet({'walletAddress': RECIPIENT}, client)
+
+    assert summary['unfetched'] == 1
+    statuses = {doc['transactionSignature']: doc['status'] for doc in db.regards.find()}
+    assert statuses == {'reverted': 'failed', 'unrelated': 'failed', 'not-found': 'pending'}
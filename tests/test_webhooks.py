@@ -0,0 +1,146 @@
+"""
+Webhook registration and outbox delivery against an in-memory database and an
+in-process HTTP sink
+
+Run with `python -m pytest tests/test_webhooks.py` (needs mongomock).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+mongomock = pytest.importorskip('mongomock')
+
+from api.jobs import outbox as dispatcher
+from api.models import outbox, webhook
+from api.utils.webhooks import verify_signature, SIGNATURE_HEADER, EVENT_ID_HEADER
+
+RECIPIENT = 'Recipient1111111111111111111111111111111111'
+
+class Sink:
+    """
+    Local webhook receiver answering every POST with `status`
+    """
+
+    def __init__(self):
+        self.status = 200
+        self.deliveries = []
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                sink.deliveries.append((dict(self.headers), body))
+                self.send_response(sink.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _aware(moment):
+    # mongomock, like the server, hands datetimes back without a timezone
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+@pytest.fixture
+def db(monkeypatch):
+    database = mongomock.MongoClient().db
+    monkeypatch.setattr(outbox, 'get_db', lambda *args: database)
+    monkeypatch.setattr(webhook, 'get_db', lambda *args: database)
+    database.users.insert_one({'walletAddress': RECIPIENT, 'username': 'recipient'})
+    return database
+
+@pytest.fixture
+def sink(monkeypatch):
+    monkeypatch.setenv('WEBHOOK_ALLOW_INSECURE', 'true')
+    server = Sink()
+    yield server
+    server.close()
+
+@pytest.fixture
+def pool():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+def _queue_regard(db):
+    regard = {
+        'sender': {'walletAddress': 'Sender', 'username': 'sender'},
+        'recipient': {'walletAddress': RECIPIENT, 'username': 'recipient'},
+        'amount': 0.5,
+        'message': 'thanks',
+        'transactionSignature': 'sig',
+        'status': 'completed',
+        'createdAt': datetime.now(UTC),
+        'outbox': outbox.new_outbox_entry(now=datetime.now(UTC) - timedelta(seconds=1))
+    }
+    return db.regards.insert_one(regard).inserted_id
+
+def test_create_webhook_enforces_the_cap(db):
+    for index in range(webhook.MAX_WEBHOOKS_PER_USER):
+        assert webhook.create_webhook(RECIPIENT, f"https://example.com/{index}") is not None
+
+    assert webhook.create_webhook(RECIPIENT, 'https://example.com/extra') is None
+    assert db.webhooks.count_documents({'walletAddress': RECIPIENT}) == webhook.MAX_WEBHOOKS_PER_USER
+    assert db.users.find_one({'walletAddress': RECIPIENT})['webhookCount'] == webhook.MAX_WEBHOOKS_PER_USER
+
+def test_create_webhook_releases_the_slot_when_the_insert_fails(db, monkeypatch):
+    def failing_insert(*args, **kwargs):
+        raise RuntimeError('insert failed')
+    monkeypatch.setattr(db.webhooks, 'insert_one', failing_insert)
+
+    with pytest.raises(RuntimeError):
+        webhook.create_webhook(RECIPIENT, 'https://example.com/hook')
+    assert db.users.find_one({'walletAddress': RECIPIENT})['webhookCount'] == 0
+
+def test_dispatch_delivers_signed_events(db, sink, pool):
+    hook = webhook.create_webhook(RECIPIENT, sink.url)
+    regard_id = _queue_regard(db)
+
+    assert dispatcher.dispatch_batch(pool) == 1
+
+    [(headers, body)] = sink.deliveries
+    assert verify_signature(hook['secret'], body, headers[SIGNATURE_HEADER])
+    assert not verify_signature('wrong-secret', body, headers[SIGNATURE_HEADER])
+    assert headers[EVENT_ID_HEADER] == str(regard_id)
+
+    regard = db.regards.find_one({'_id': regard_id})
+    assert 'outbox' not in regard
+    assert 'notifiedAt' in regard
+
+def test_dispatch_retries_with_backoff_then_gives_up(db, sink, pool, monkeypatch):
+    monkeypatch.setattr(outbox, 'OUTBOX_MAX_ATTEMPTS', 2)
+    webhook.create_webhook(RECIPIENT, sink.url)
+    regard_id = _queue_regard(db)
+    sink.status = 500
+
+    before = datetime.now(UTC)
+    assert dispatcher.dispatch_batch(pool) == 1
+
+    entry = db.regards.find_one({'_id': regard_id})['outbox']
+    assert entry['state'] == 'pending'
+    assert entry['attempts'] == 1
+    assert 'HTTP 500' in entry['lastError']
+    assert 'leaseId' not in entry
+    # Backed off: not due again until at least half the base delay has passed
+    assert _aware(entry['nextAttemptAt']) >= before + outbox.OUTBOX_BACKOFF_BASE / 2
+    assert dispatcher.dispatch_batch(pool) == 0
+
+    db.regards.update_one({'_id': regard_id}, {'$set': {'outbox.nextAttemptAt': datetime.now(UTC)}})
+    assert dispatcher.dispatch_batch(pool) == 1
+
+    entry = db.regards.find_one({'_id': regard_id})['outbox']
+    assert entry['state'] == 'dead'
+    assert entry['attempts'] == 2
+    assert 'nextAttemptAt' not in entry
+    assert len(sink.deliveries) == 2
+    assert dispatcher.dispatch_batch(pool) == 0